@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+album.py — collect the photos of a Telegram album (media group) for FilmSimBot
+
+Telegram delivers an album as separate messages sharing a media_group_id,
+with no marker on the last one. The collector groups them per (user,
+media_group_id) and hands the complete album to `on_complete` once no
+new item has arrived for `quiet` seconds:
+
+- begin() before downloading an item, add() (or cancel()) after it; an
+  album is never completed while one of its downloads is still running
+- items come back ordered by message id (the order the user picked)
+- at most `max_items` per album (Telegram's limit is 10); begin() returns
+  False for extras
+
+on_complete runs on a timer thread.
+
+Usage:
+    from album import AlbumCollector
+    albums = AlbumCollector(lambda key, items, meta: ..., quiet=1.5)
+    key = (uid, m.media_group_id)
+    if albums.begin(key, chat_id=m.chat.id):
+        try:
+            path = download(...)
+        except Exception:
+            albums.cancel(key)
+            raise
+        albums.add(key, m.message_id, path)
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, Hashable, List, Optional
+
+MAX_ITEMS = 10
+
+
+class _Album:
+    __slots__ = ("items", "meta", "pending", "timer", "armed")
+
+    def __init__(self, meta: dict):
+        self.items: Dict[int, object] = {}   # message id -> item
+        self.meta = meta
+        self.pending = 0                      # downloads begun but not added yet
+        self.timer: Optional[threading.Timer] = None
+        self.armed = 0                        # bumped per timer; a stale timer sees a newer value
+
+
+class AlbumCollector:
+    def __init__(self, on_complete: Callable[[Hashable, List[object], dict], None], quiet: float = 1.5,
+                 max_items: int = MAX_ITEMS):
+        self.on_complete = on_complete
+        self.quiet = quiet
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._albums: Dict[Hashable, _Album] = {}
+
+    def begin(self, key: Hashable, **meta) -> bool:
+        """Reserve a slot for one more item. `meta` (first call wins) is passed to on_complete."""
+        with self._lock:
+            album = self._albums.get(key)
+            if album is None:
+                album = self._albums[key] = _Album(meta)
+            if len(album.items) + album.pending >= self.max_items:
+                return False
+            album.pending += 1
+            self._cancel_timer(album)
+            return True
+
+    def add(self, key: Hashable, message_id: int, item) -> None:
+        with self._lock:
+            album = self._albums[key]
+            album.pending -= 1
+            album.items[message_id] = item
+            self._arm(key, album)
+
+    def cancel(self, key: Hashable) -> None:
+        """A begun item failed; the rest of the album still completes."""
+        with self._lock:
+            album = self._albums[key]
+            album.pending -= 1
+            self._arm(key, album)
+
+    # ---------- internals ----------
+
+    @staticmethod
+    def _cancel_timer(album: _Album) -> None:
+        if album.timer is not None:
+            album.timer.cancel()
+            album.timer = None
+
+    def _arm(self, key: Hashable, album: _Album) -> None:
+        """Caller holds the lock. (Re)start the quiet period once nothing is downloading."""
+        self._cancel_timer(album)
+        if album.pending:
+            return
+        album.armed += 1
+        album.timer = threading.Timer(self.quiet, self._fire, args=(key, album, album.armed))
+        album.timer.daemon = True
+        album.timer.start()
+
+    def _fire(self, key: Hashable, album: _Album, armed: int) -> None:
+        with self._lock:
+            if self._albums.get(key) is not album or album.pending or album.armed != armed:
+                return  # another item arrived meanwhile
+            del self._albums[key]
+        if not album.items:
+            return
+        items = [album.items[mid] for mid in sorted(album.items)]
+        try:
+            self.on_complete(key, items, album.meta)
+        except Exception as e:
+            print(f"album {key} failed: {e}")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+bench_album.py — album batch export vs one export job per photo
+
+Renders the same synthetic album (bench_pipeline's images and LUT) two ways:
+- jobs:  one lut_engine.render_file per photo, as N separate export jobs
+         would, spread over --workers bot workers (FILMSIM_WORKERS, 1 by
+         default in-process); the LUT is preloaded, as LutCache would have it
+- batch: lut_engine.render_files over the whole album (decode / render /
+         encode pipelined across photos)
+
+With --pool N the same comparison runs through a RenderPool of N workers:
+N concurrent render() calls (N bot workers) vs one render_batch().
+
+Reports wall time and throughput (photos/s) for each, and the batch's
+throughput gain over separate jobs.
+
+Usage:
+    python3 benchmarks/bench_album.py [--photos 10] [--mp 12] [--max-side 2560] [--repeat 3]
+        [--workers 1] [--pool 0] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import lut_engine  # noqa: E402
+from bench_pipeline import write_cube, write_image  # noqa: E402
+
+MAX_PHOTO_BYTES = 10 * 1024 * 1024
+
+
+def run_jobs(items, lut_path, lut, intensity, max_side, max_bytes, pool, workers):
+    if pool is None:
+        def job(it):
+            lut_engine.render_file(it[0], lut_path, it[1], intensity, lut=lut,
+                                   max_side=max_side, max_bytes=max_bytes)
+    else:
+        def job(it):
+            pool.render(it[0], lut_path, it[1], intensity, max_side=max_side, max_bytes=max_bytes)
+    if workers <= 1:
+        for it in items:
+            job(it)
+        return
+    with ThreadPoolExecutor(workers) as ex:
+        list(ex.map(job, items))
+
+
+def run_batch(items, lut_path, lut, intensity, max_side, max_bytes, pool, workers):
+    if pool is None:
+        lut_engine.render_files(items, lut_path, intensity, lut=lut, max_side=max_side, max_bytes=max_bytes)
+    else:
+        pool.render_batch(items, lut_path, intensity, max_side=max_side, max_bytes=max_bytes)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--photos", type=int, default=10)
+    ap.add_argument("--mp", type=float, default=12)
+    ap.add_argument("--lut-size", type=int, default=33)
+    ap.add_argument("--max-side", type=int, default=2560, help="0 = full resolution")
+    ap.add_argument("--intensity", type=float, default=0.75)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--workers", type=int, default=1, help="bot workers running the separate jobs in-process")
+    ap.add_argument("--pool", type=int, default=0, help="RenderPool workers (0 = in-process)")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    max_side = args.max_side or None
+    max_bytes = MAX_PHOTO_BYTES if max_side else None
+    pool = None
+    if args.pool:
+        from render_pool import RenderPool
+        pool = RenderPool(processes=args.pool)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as d:
+        lut_path = os.path.join(d, "bench.cube")
+        write_cube(lut_path, args.lut_size)
+        lut = lut_engine.load_cube(lut_path)
+        src = os.path.join(d, "src.jpg")
+        write_image(src, "jpeg", args.mp)
+        items = []
+        for i in range(args.photos):
+            in_path = os.path.join(d, f"in_{i}.jpg")
+            os.link(src, in_path)
+            items.append((in_path, os.path.join(d, f"out_{i}.jpg")))
+
+        for name, fn in (("jobs", run_jobs), ("batch", run_batch)):
+            runs = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                fn(items, lut_path, lut, args.intensity, max_side, max_bytes, pool, args.pool or args.workers)
+                runs.append(time.perf_counter() - t0)
+            total = statistics.median(runs)
+            results[name] = {"seconds": round(total, 3), "per_photo": round(total / args.photos, 3),
+                             "photos_per_s": round(args.photos / total, 2)}
+
+    if pool is not None:
+        pool.close()
+    results["speedup"] = round(results["batch"]["photos_per_s"] / results["jobs"]["photos_per_s"], 2)
+
+    if args.json:
+        print(json.dumps({"config": vars(args), "cpu_count": os.cpu_count(), "results": results}, indent=2))
+        return
+    where = (f"RenderPool({args.pool})" if pool is not None else
+             f"in-process, {args.workers} worker(s), {lut_engine.RENDER_THREADS} tile threads")
+    print(f"{args.photos} × {args.mp:g}MP, max side {max_side or 'full'}, {where}")
+    for name in ("jobs", "batch"):
+        r = results[name]
+        print(f"{name:<6}{r['seconds']:>8.2f}s  {r['per_photo']:>6.3f}s/photo  {r['photos_per_s']:>6.2f} photos/s")
+    print(f"batch throughput {results['speedup']:.2f}x separate jobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+bench_db.py — FilmSimDB operations per second, before vs after connection reuse
+
+"before" is the old behaviour reproduced in a subclass: a fresh connection
+(plus both pragmas) per call, and can_process as two separate lookups.
+
+Usage:
+    python3 benchmarks/bench_db.py [--ops 5000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filmsim_db import FilmSimDB  # noqa: E402
+
+
+class LegacyFilmSimDB(FilmSimDB):
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_path)
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute("PRAGMA synchronous=NORMAL;")
+        return con
+
+    def can_process(self, telegram_id, free_daily_limit):
+        used = self.get_usage_today(telegram_id)
+        if self.is_premium(telegram_id):
+            return True, used, free_daily_limit
+        return (used < free_daily_limit), used, free_daily_limit
+
+
+def bench(db: FilmSimDB, ops: int) -> dict:
+    users = 50
+    for uid in range(0, users, 5):
+        db.grant_premium_days(uid, 30)
+
+    out = {}
+    t = time.perf_counter()
+    for i in range(ops):
+        db.can_process(i % users, 5)
+    out["can_process"] = ops / (time.perf_counter() - t)
+
+    t = time.perf_counter()
+    for i in range(ops):
+        db.is_premium(i % users)
+    out["is_premium"] = ops / (time.perf_counter() - t)
+
+    n = max(1, ops // 10)  # writes are much slower; keep the run short
+    t = time.perf_counter()
+    for i in range(n):
+        db.increment_usage(i % users)
+    out["increment_usage"] = n / (time.perf_counter() - t)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--ops", type=int, default=5000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        before = bench(LegacyFilmSimDB(os.path.join(d, "before.db")), args.ops)
+        after = bench(FilmSimDB(os.path.join(d, "after.db")), args.ops)
+
+    print(f"{'operation':<18}{'before ops/s':>14}{'after ops/s':>14}{'speedup':>10}")
+    for k in before:
+        print(f"{k:<18}{before[k]:>14.0f}{after[k]:>14.0f}{after[k] / before[k]:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
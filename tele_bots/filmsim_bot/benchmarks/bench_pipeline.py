@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+bench_pipeline.py — per-stage cost of an export, per megapixel, as JSON
+
+Generates synthetic inputs (deterministic, so runs are comparable across
+commits and machines):
+- images: gradients + edges + noise, 2-50MP, JPEG / 8-bit PNG / 16-bit PNG
+- LUTs: a film-ish curve as 17³ / 33³ / 65³ .cube files
+
+and times each backend:
+- python: lut_load, decode, lut_apply, blend, grain (dither), encode,
+  metadata — stages summed over the same strips lut_engine.render uses,
+  plus `render`, the real (threaded) lut_engine.render end to end
+- gmic: apply_lut.sh end to end (it can't be split); skipped without gmic
+
+Each number is the median of --repeat runs. Results go to stdout (or
+--out) as JSON; `per_mp` is seconds per megapixel.
+
+Usage:
+    python3 benchmarks/bench_pipeline.py [--sizes 2,12] [--lut-sizes 33]
+        [--formats jpeg,png8,png16] [--backends python,gmic] [--repeat 3] [--out bench.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_DIR)
+
+import numpy as np  # noqa: E402
+import PIL  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import lut_engine  # noqa: E402
+from decode import decode  # noqa: E402
+from jpeg_encoder import encode_jpeg  # noqa: E402
+
+FORMATS = {"jpeg": (".jpg", 8), "png8": (".png", 8), "png16": (".png", 16)}
+PYTHON_STAGES = ("lut_load", "decode", "lut_apply", "blend", "grain", "encode", "metadata", "render")
+
+
+# ---------- synthetic inputs ----------
+
+def synth_rgb(mp: float, bits: int, seed: int = 0) -> np.ndarray:
+    """3:2 image of about `mp` megapixels: smooth gradients, hard edges, sensor-ish noise."""
+    w = int(round((mp * 1e6 * 1.5) ** 0.5))
+    h = int(round(w / 1.5))
+    rng = np.random.default_rng(seed)
+    top = (1 << bits) - 1
+    out = np.empty((h, w, 3), dtype=np.uint16 if bits > 8 else np.uint8)
+    x = np.linspace(0.0, 1.0, w, dtype=np.float32)
+    rows = max(1, (4 << 20) // w)  # build in strips; 50MP float would be huge
+    for y0 in range(0, h, rows):
+        y = np.linspace(y0 / h, min(h, y0 + rows) / h, min(rows, h - y0), dtype=np.float32)[:, None]
+        r = x[None, :] * 0.8 + y * 0.2
+        g = 0.5 + 0.4 * np.sin(6.0 * x[None, :] + 4.0 * y)
+        b = ((x[None, :] * 12).astype(np.int32) + (y * 8).astype(np.int32)) % 2 * 0.6 + 0.2  # checker edges
+        strip = np.stack(np.broadcast_arrays(r, g, b), axis=-1)
+        strip += rng.normal(0.0, 0.02, strip.shape).astype(np.float32)
+        out[y0:y0 + rows] = np.clip(strip * top, 0, top).astype(out.dtype)
+    return out
+
+
+def write_png16(path: str, rgb: np.ndarray) -> None:
+    """Pillow can't write 48-bit RGB PNGs, so write the chunks directly."""
+    h, w = rgb.shape[:2]
+    raw = np.empty((h, 1 + w * 6), dtype=np.uint8)
+    raw[:, 0] = 0  # filter: none
+    raw[:, 1:] = rgb.astype(">u2").view(np.uint8).reshape(h, w * 6)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 16, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def write_image(path: str, fmt: str, mp: float) -> tuple:
+    ext, bits = FORMATS[fmt]
+    rgb = synth_rgb(mp, bits)
+    if fmt == "png16":
+        write_png16(path, rgb)
+    elif fmt == "png8":
+        Image.fromarray(rgb, "RGB").save(path, compress_level=6)
+    else:
+        Image.fromarray(rgb, "RGB").save(path, quality=92)
+    return rgb.shape[1], rgb.shape[0]
+
+
+def write_cube(path: str, size: int) -> None:
+    """Lifted blacks, soft S-curve, warm highlights / cool shadows."""
+    v = np.linspace(0.0, 1.0, size, dtype=np.float64)
+    b, g, r = np.meshgrid(v, v, v, indexing="ij")  # .cube order: red fastest
+    rgb = np.stack([r, g, b], axis=-1).reshape(-1, 3)
+    s = rgb * rgb * (3 - 2 * rgb)
+    out = 0.03 + 0.94 * (0.6 * s + 0.4 * rgb)
+    luma = out @ np.array([0.299, 0.587, 0.114])
+    out[:, 0] += 0.04 * (luma - 0.5)
+    out[:, 2] -= 0.04 * (luma - 0.5)
+    np.clip(out, 0, 1, out=out)
+    with open(path, "w") as f:
+        f.write(f'TITLE "bench {size}"\nLUT_3D_SIZE {size}\n')
+        f.write("\n".join(f"{a:.6f} {b:.6f} {c:.6f}" for a, b, c in out))
+        f.write("\n")
+
+
+# ---------- backends ----------
+
+def bench_python(in_path: str, lut_path: str, out_path: str, intensity: float, exiftool) -> dict:
+    t = {}
+    t0 = time.perf_counter()
+    lut = lut_engine.load_cube(lut_path)
+    t["lut_load"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with decode(in_path) as img:
+        src = np.asarray(img.convert("RGB"))
+    t["decode"] = time.perf_counter() - t0
+
+    # same strips as lut_engine.render, single-threaded so stages add up
+    h, w = src.shape[:2]
+    rows = max(1, lut_engine.TILE_PIXELS // w)
+    out = np.empty_like(src)
+    t["lut_apply"] = t["blend"] = t["grain"] = 0.0
+    rng = np.random.default_rng(0)
+    for y0 in range(0, h, rows):
+        rgb = src[y0:y0 + rows].astype(np.float32)
+        rgb *= 1.0 / 255.0
+        t0 = time.perf_counter()
+        graded = lut_engine.apply_lut(rgb, lut)
+        t1 = time.perf_counter()
+        mixed = lut_engine.blend(rgb, graded, intensity)
+        t2 = time.perf_counter()
+        out[y0:y0 + rows] = lut_engine.quantize_dithered(mixed, rng=rng)
+        t3 = time.perf_counter()
+        t["lut_apply"] += t1 - t0
+        t["blend"] += t2 - t1
+        t["grain"] += t3 - t2
+
+    t0 = time.perf_counter()
+    encode_jpeg(Image.fromarray(out, "RGB"), out_path, quality=lut_engine.JPEG_QUALITY)
+    t["encode"] = time.perf_counter() - t0
+
+    if exiftool is not None:
+        t0 = time.perf_counter()
+        lut_engine.annotate_metadata(in_path, out_path, lut_path, intensity, exiftool=exiftool)
+        t["metadata"] = time.perf_counter() - t0
+
+    with Image.open(in_path) as img:
+        t0 = time.perf_counter()
+        lut_engine.render(img, lut, intensity)
+        t["render"] = time.perf_counter() - t0
+    return t
+
+
+def bench_gmic(in_path: str, lut_path: str, out_path: str, intensity: float, exiftool) -> dict:
+    t0 = time.perf_counter()
+    subprocess.run([os.path.join(BOT_DIR, "apply_lut.sh"), in_path, lut_path, out_path, str(intensity)],
+                   check=True, stdout=subprocess.DEVNULL)
+    return {"total": time.perf_counter() - t0}
+
+
+BACKENDS = {"python": bench_python, "gmic": bench_gmic}
+
+
+def median_stages(runs: list) -> dict:
+    return {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "-C", BOT_DIR, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--sizes", default="2,12", help="megapixels, comma separated (up to 50)")
+    ap.add_argument("--lut-sizes", default="33", help="cube sizes, e.g. 17,33,65")
+    ap.add_argument("--formats", default="jpeg,png8,png16", help=",".join(FORMATS))
+    ap.add_argument("--backends", default="python,gmic", help=",".join(BACKENDS))
+    ap.add_argument("--intensity", type=float, default=0.75)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    args = ap.parse_args()
+
+    sizes = [float(s) for s in args.sizes.split(",")]
+    lut_sizes = [int(s) for s in args.lut_sizes.split(",")]
+    formats = args.formats.split(",")
+    backends = args.backends.split(",")
+
+    exiftool = None
+    if shutil.which("exiftool"):
+        from exiftool_daemon import ExifToolDaemon
+        exiftool = ExifToolDaemon()
+
+    results = []
+    with tempfile.TemporaryDirectory() as d:
+        luts = {}
+        for n in lut_sizes:
+            luts[n] = os.path.join(d, f"bench_{n}.cube")
+            write_cube(luts[n], n)
+
+        for fmt in formats:
+            for mp in sizes:
+                in_path = os.path.join(d, f"in_{mp:g}mp_{fmt}{FORMATS[fmt][0]}")
+                w, h = write_image(in_path, fmt, mp)
+                for n in lut_sizes:
+                    for backend in backends:
+                        row = {"backend": backend, "format": fmt, "bits": FORMATS[fmt][1],
+                               "width": w, "height": h, "megapixels": round(w * h / 1e6, 2),
+                               "file_bytes": os.path.getsize(in_path), "lut_size": n}
+                        if backend == "gmic" and not shutil.which("gmic"):
+                            results.append({**row, "skipped": "gmic not found"})
+                            continue
+                        out_path = os.path.join(d, "out.jpg")
+                        runs = [BACKENDS[backend](in_path, luts[n], out_path, args.intensity, exiftool)
+                                for _ in range(args.repeat)]
+                        stages = median_stages(runs)
+                        row["seconds"] = {k: round(v, 5) for k, v in stages.items()}
+                        row["per_mp"] = {k: round(v / row["megapixels"], 5) for k, v in stages.items()}
+                        results.append(row)
+                        print(f"{backend:<7}{fmt:<6}{row['megapixels']:>6.1f}MP  lut {n:>2}³  "
+                              + "  ".join(f"{k} {v:.3f}" for k, v in stages.items()), file=sys.stderr)
+                os.remove(in_path)
+
+    if exiftool is not None:
+        exiftool.close()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+        },
+        "config": {
+            "repeat": args.repeat,
+            "intensity": args.intensity,
+            "tile_pixels": lut_engine.TILE_PIXELS,
+            "render_threads": lut_engine.RENDER_THREADS,
+            "interp": lut_engine.DEFAULT_INTERP,
+            "jpeg_quality": lut_engine.JPEG_QUALITY,
+            "exiftool": exiftool is not None,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
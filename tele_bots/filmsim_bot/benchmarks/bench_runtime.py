@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+bench_runtime.py — update latency vs TeleBot handler threads
+
+A local fake Bot API delivers a burst of callback queries from several
+users in one getUpdates batch and answers every other method after
+--latency seconds, like a slow link to Telegram would. A TeleBot serves
+them with the same blocking handler as the browsing callbacks in
+filmsim_bot (answer the callback, then edit the menu), once per
+--threads value (num_threads; TeleBot's default is 2).
+
+Latency per update = first answerCallbackQuery for it − time getUpdates
+handed it out; that's the spinner a user watches on the button.
+
+Usage:
+    python3 benchmarks/bench_runtime.py [--updates 60] [--users 30] [--latency 0.1]
+        [--threads 2,8,32] [--json]
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import telebot
+from telebot import apihelper
+
+TOKEN = "123456:bench"
+telebot.logger.setLevel(logging.CRITICAL)  # polling retries while a fake server shuts down
+
+
+class FakeTelegram:
+    def __init__(self, updates: int, users: int, latency: float):
+        self.latency = latency
+        self.updates = [self._update(i, 1000 + i % users) for i in range(1, updates + 1)]
+        self.served_at = None
+        self.answered = {}
+        self.edits = 0
+        self.done = threading.Event()  # every update answered and its menu edited
+        self._lock = threading.Lock()
+        self.server = None
+
+    @staticmethod
+    def _message(chat_id: int) -> dict:
+        return {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": "Pick a filter:"}
+
+    def _update(self, i: int, uid: int) -> dict:
+        return {"update_id": i, "callback_query": {
+            "id": str(i), "chat_instance": "bench", "data": "page|1|0|1",
+            "from": {"id": uid, "is_bot": False, "first_name": "u"},
+            "message": self._message(uid),
+        }}
+
+    def handle(self, method: str, params: dict):
+        if method == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            with self._lock:
+                pending = [u for u in self.updates if u["update_id"] >= offset]
+                if pending and self.served_at is None:
+                    self.served_at = time.perf_counter()
+                    return pending
+            time.sleep(0.2)
+            return []
+
+        time.sleep(self.latency)
+        with self._lock:
+            if method == "answerCallbackQuery":
+                self.answered.setdefault(params.get("callback_query_id"), time.perf_counter())
+                return True
+            if method == "getMe":
+                return {"id": 1, "is_bot": True, "first_name": "bench"}
+            if method == "editMessageText":
+                self.edits += 1
+                if self.edits >= len(self.updates):
+                    self.done.set()
+        return self._message(1)
+
+    def start(self) -> None:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _serve(self):
+                url = urlparse(self.path)
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    params.update(parse_qsl(self.rfile.read(length).decode()))
+                body = json.dumps({"ok": True, "result": fake.handle(url.path.rsplit("/", 1)[-1], params)})
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        apihelper.API_URL = f"http://127.0.0.1:{self.server.server_address[1]}/bot{{0}}/{{1}}"
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+    def latencies(self) -> list:
+        return sorted(t - self.served_at for t in self.answered.values())
+
+
+def run(fake: FakeTelegram, threads: int, wait: float) -> None:
+    bot = telebot.TeleBot(TOKEN, num_threads=threads)
+
+    @bot.callback_query_handler(func=lambda c: True)
+    def cb(c):
+        bot.answer_callback_query(c.id)
+        bot.edit_message_text("Pick a filter:", c.message.chat.id, c.message.message_id)
+
+    t = threading.Thread(target=bot.infinity_polling, kwargs={"timeout": 1, "long_polling_timeout": 1},
+                         daemon=True)
+    t.start()
+    fake.done.wait(wait)
+    bot.stop_polling()
+    t.join(5)  # let the last getUpdates return before the fake server goes away
+
+
+def summary(lat: list, expected: int) -> dict:
+    if not lat:
+        return {"answered": 0, "expected": expected}
+    q = statistics.quantiles(lat, n=100) if len(lat) > 1 else [lat[0]] * 99
+    return {"answered": len(lat), "expected": expected, "p50": q[49], "p95": q[94], "max": lat[-1]}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--updates", type=int, default=60)
+    ap.add_argument("--users", type=int, default=30)
+    ap.add_argument("--latency", type=float, default=0.1, help="seconds per Bot API call")
+    ap.add_argument("--threads", default="2,8,32", help="TeleBot num_threads values, comma separated")
+    ap.add_argument("--wait", type=float, default=120)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    results = {}
+    for threads in (int(n) for n in args.threads.split(",")):
+        fake = FakeTelegram(args.updates, args.users, args.latency)
+        fake.start()
+        run(fake, threads, args.wait)
+        fake.stop()
+        results[threads] = summary(fake.latencies(), args.updates)
+
+    if args.json:
+        print(json.dumps({"config": vars(args), "results": results}, indent=2))
+        return
+    print(f"{args.updates} callbacks from {args.users} users, {args.latency * 1000:.0f}ms per API call")
+    print(f"{'threads':<9}{'answered':>9}{'p50 s':>9}{'p95 s':>9}{'max s':>9}")
+    for threads, r in results.items():
+        if not r["answered"]:
+            print(f"{threads:<9}{0:>9}")
+            continue
+        print(f"{threads:<9}{r['answered']:>9}{r['p50']:>9.2f}{r['p95']:>9.2f}{r['max']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+exiftool_daemon.py — one long-lived `exiftool -stay_open` process for FilmSimBot
+
+Starting exiftool costs a Perl interpreter start per call; this keeps one
+running and feeds it commands over stdin.
+
+- thread safe (one command at a time)
+- per-command timeout; a hung process is killed and restarted
+- restarts transparently if the process has died
+
+Usage:
+    from exiftool_daemon import ExifToolDaemon
+    et = ExifToolDaemon()
+    et.execute("-overwrite_original", "-XMP:Subject+=foo", "out.jpg")
+    et.close()
+"""
+
+from __future__ import annotations
+
+import os
+import select
+import subprocess
+import threading
+import time
+from typing import Optional
+
+
+class ExifToolError(RuntimeError):
+    pass
+
+
+class ExifToolDaemon:
+    def __init__(self, executable: str = "exiftool", timeout: float = 30.0):
+        self.executable = executable
+        self.timeout = timeout
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.restarts = 0
+        self._started = False
+
+    # ---------- lifecycle ----------
+
+    def start(self) -> None:
+        with self._lock:
+            self._ensure_running()
+
+    def close(self) -> None:
+        with self._lock:
+            self._stop(graceful=True)
+            self._started = False
+
+    def _ensure_running(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            return
+        if self._started:
+            self.restarts += 1
+            print("exiftool not running; restarting")
+        self._started = True
+        self._proc = subprocess.Popen(
+            [self.executable, "-stay_open", "True", "-@", "-", "-common_args", "-charset", "filename=utf8"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def _stop(self, graceful: bool) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None or proc.poll() is not None:
+            return
+        if graceful:
+            try:
+                proc.stdin.write(b"-stay_open\nFalse\n")
+                proc.stdin.flush()
+                proc.wait(timeout=5)
+                return
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        proc.kill()
+        proc.wait()
+
+    # ---------- commands ----------
+
+    def execute(self, *args: str, timeout: Optional[float] = None) -> str:
+        """
+        Run one exiftool command (args as you'd pass on the CLI, without
+        `exiftool` itself). Returns stdout. Raises ExifToolError / TimeoutError.
+        """
+        for a in args:
+            if "\n" in a or "\r" in a:
+                raise ValueError("exiftool arguments cannot contain newlines")
+
+        with self._lock:
+            for attempt in (0, 1):
+                self._ensure_running()
+                try:
+                    out, err = self._run(args, timeout or self.timeout)
+                    break
+                except BrokenPipeError:
+                    # died between commands or mid-command: restart once
+                    self._stop(graceful=False)
+                    if attempt:
+                        raise ExifToolError("exiftool crashed")
+                except TimeoutError:
+                    self._stop(graceful=False)
+                    raise
+
+        if "Error:" in err:
+            raise ExifToolError(err.strip())
+        return out
+
+    def _run(self, args, timeout: float):
+        self._seq += 1
+        marker = f"{{ready{self._seq}}}".encode()
+        payload = "\n".join(args) + f"\n-echo4\n{{ready{self._seq}}}\n-execute{self._seq}\n"
+
+        proc = self._proc
+        try:
+            proc.stdin.write(payload.encode("utf-8"))
+            proc.stdin.flush()
+        except (OSError, ValueError):
+            raise BrokenPipeError
+
+        bufs = {proc.stdout.fileno(): b"", proc.stderr.fileno(): b""}
+        pending = set(bufs)
+        deadline = time.monotonic() + timeout
+        while pending:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise TimeoutError(f"exiftool timed out after {timeout:.0f}s")
+            ready, _, _ = select.select(list(pending), [], [], left)
+            for fd in ready:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise BrokenPipeError
+                bufs[fd] += chunk
+                if bufs[fd].rstrip().endswith(marker):
+                    pending.discard(fd)
+
+        out = bufs[proc.stdout.fileno()].rstrip()[: -len(marker)]
+        err = bufs[proc.stderr.fileno()].rstrip()[: -len(marker)]
+        return out.decode("utf-8", "replace"), err.decode("utf-8", "replace")
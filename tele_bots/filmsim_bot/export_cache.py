@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+export_cache.py — content-addressed cache of finished exports for FilmSimBot
+
+Keyed by (input content hash, LUT id + mtime, intensity, output variant
+such as the delivery size). Stores:
+- the rendered JPEG (size-bounded, least recently used evicted first)
+- the Telegram file_id it was delivered as, so a repeat can be re-sent
+  by file_id with no render and no upload
+
+Lookups don't write: last-used times are kept in memory and written in one
+batch every `flush_interval` seconds, before eviction and on close().
+
+Usage:
+    from export_cache import ExportCache
+    cache = ExportCache("/path/to/work/exports", max_bytes=512 * 1024 * 1024)
+    key = cache.key(in_hash, lut_id, lut_mtime_ns, 0.75)
+    hit = cache.get(key)
+    cache.close()
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class CachedExport:
+    key: str
+    path: Optional[str]        # None if the file was evicted but the file_id survives
+    file_id: Optional[str]
+    kind: Optional[str]        # "photo" or "document"
+
+
+class ExportCache:
+    def __init__(self, root: str, max_bytes: int = 512 * 1024 * 1024, flush_interval: float = 60.0):
+        self.root = os.path.abspath(root)
+        self.max_bytes = int(max_bytes)
+        self.flush_interval = flush_interval
+        os.makedirs(self.root, exist_ok=True)
+        self.db_path = os.path.join(self.root, "index.db")
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._touched: Dict[str, float] = {}   # key -> last_used not yet written
+        self._touch_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._init_db()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.db_path)
+            con.execute("PRAGMA journal_mode=WAL;")
+            con.execute("PRAGMA synchronous=NORMAL;")
+            self._local.con = con
+        return con
+
+    def _init_db(self) -> None:
+        with self._connect() as con:
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS exports (
+                    key       TEXT PRIMARY KEY,
+                    size      INTEGER NOT NULL DEFAULT 0,  -- bytes on disk, 0 once evicted
+                    file_id   TEXT,                        -- Telegram file_id, nullable
+                    kind      TEXT,                        -- photo | document
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS exports_lru ON exports(last_used)")
+            con.commit()
+
+    @staticmethod
+    def key(in_hash: str, lut_id, lut_mtime_ns: int, intensity, variant: str = "") -> str:
+        raw = f"{in_hash}|{lut_id}|{lut_mtime_ns}|{float(intensity):.4f}|{variant}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".jpg")
+
+    # ---------- lookups ----------
+
+    def get(self, key: str) -> Optional[CachedExport]:
+        row = self._connect().execute(
+            "SELECT size, file_id, kind FROM exports WHERE key=?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        with self._touch_lock:
+            self._touched[key] = time.time()
+
+        size, file_id, kind = row
+        path = self._file(key) if size and os.path.isfile(self._file(key)) else None
+        if path is None and not file_id:
+            return None
+        return CachedExport(key=key, path=path, file_id=file_id, kind=kind)
+
+    # ---------- writes ----------
+
+    def put(self, key: str, src_path: str) -> str:
+        """Move a finished export into the cache. Returns its cached path."""
+        dest = self._file(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(src_path, dest)
+        size = os.path.getsize(dest)
+        with self._lock:
+            with self._connect() as con:
+                con.execute(
+                    """
+                    INSERT INTO exports (key, size, last_used)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(key)
+                    DO UPDATE SET size=excluded.size, last_used=excluded.last_used
+                    """,
+                    (key, size, time.time()),
+                )
+                con.commit()
+            self._evict()
+        return dest
+
+    def set_file_id(self, key: str, file_id: str, kind: str) -> None:
+        with self._connect() as con:
+            con.execute(
+                "UPDATE exports SET file_id=?, kind=? WHERE key=?",
+                (file_id, kind, key),
+            )
+            con.commit()
+
+    def forget_file_id(self, key: str) -> None:
+        """Telegram rejected the cached file_id; fall back to the file (if any)."""
+        with self._connect() as con:
+            con.execute("UPDATE exports SET file_id=NULL, kind=NULL WHERE key=?", (key,))
+            con.commit()
+
+    def flush(self) -> int:
+        """Write pending last-used times in one transaction. Returns rows written."""
+        with self._touch_lock:
+            batch, self._touched = self._touched, {}
+        if not batch:
+            return 0
+        with self._connect() as con:
+            con.executemany(
+                "UPDATE exports SET last_used=MAX(last_used, ?) WHERE key=?",
+                [(ts, key) for key, ts in batch.items()],
+            )
+        return len(batch)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"export cache flush failed: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def _evict(self) -> None:
+        """Drop least recently used files until under budget. file_ids are kept (tiny)."""
+        self.flush()  # LRU order must see recent hits
+        with self._connect() as con:
+            total = con.execute("SELECT COALESCE(SUM(size), 0) FROM exports").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = con.execute(
+                "SELECT key, size FROM exports WHERE size > 0 ORDER BY last_used"
+            ).fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self._file(key))
+                except OSError:
+                    pass
+                con.execute("UPDATE exports SET size=0 WHERE key=?", (key,))
+                total -= size
+            # rows with neither a file nor a file_id are useless
+            con.execute("DELETE FROM exports WHERE size=0 AND file_id IS NULL")
+            con.commit()
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import os, uuid, math, subprocess, threading, queue, time, sys
+import os, uuid, math, subprocess, threading, queue, time, sys, shutil, atexit, multiprocessing
 from pathlib import Path
 
 import telebot
@@ -31,21 +31,79 @@ SCRIPT = os.path.join(BASE, "apply_lut.sh")
 
 os.makedirs(WORK_DIR, exist_ok=True)
 
-if not os.path.isfile(SCRIPT):
+# Render backend: "python" (in-process NumPy engine) or "gmic" (apply_lut.sh fallback)
+BACKEND = os.environ.get("FILMSIM_BACKEND", "python").lower()
+if BACKEND not in ("python", "gmic"):
+    raise RuntimeError(f"Unknown FILMSIM_BACKEND: {BACKEND}")
+
+if BACKEND == "python":
+    try:
+        import lut_engine
+    except ImportError as e:
+        print(f"lut_engine unavailable ({e}); falling back to apply_lut.sh")
+        BACKEND = "gmic"
+
+if BACKEND == "gmic" and not os.path.isfile(SCRIPT):
     raise RuntimeError(f"apply_lut.sh not found at {SCRIPT}")
 
+# Compiled LUT cache (python backend only): float16 .npy beside the library + in-memory LRU
+LUT_CACHE_DIR = os.environ.get("FILMSIM_LUT_CACHE_DIR", os.path.join(LUT_DIR, ".lutcache"))
+LUT_CACHE_MB = int(os.environ.get("FILMSIM_LUT_CACHE_MB", "256"))
+LUT_CACHE = None
+if BACKEND == "python":
+    from lut_cache import LutCache
+    LUT_CACHE = LutCache(LUT_CACHE_DIR, max_bytes=LUT_CACHE_MB * 1024 * 1024)
+
+# One long-lived exiftool for metadata copy/annotate (python backend only)
+EXIFTOOL_TIMEOUT = float(os.environ.get("FILMSIM_EXIFTOOL_TIMEOUT", "30"))
+EXIFTOOL = None
+if BACKEND == "python" and shutil.which("exiftool"):
+    from exiftool_daemon import ExifToolDaemon
+    EXIFTOOL = ExifToolDaemon(timeout=EXIFTOOL_TIMEOUT)
+    atexit.register(EXIFTOOL.close)
+
+# Execution mode: "thread" renders inside the worker threads; "process" hands
+# renders to a fork-based pool so the bot's GIL only does Telegram I/O.
+# Created before any other threads start.
+EXEC_MODE = os.environ.get("FILMSIM_EXEC_MODE", "thread").lower()
+RENDER_PROCESSES = int(os.environ.get("FILMSIM_RENDER_PROCESSES", "0")) or (os.cpu_count() or 1)
+RENDER_MAX_TASKS = int(os.environ.get("FILMSIM_RENDER_MAX_TASKS", "0"))      # recycle worker after N jobs (0 = never)
+RENDER_MEM_LIMIT_MB = int(os.environ.get("FILMSIM_RENDER_MEM_MB", "0"))     # 0 = no ceiling
+RENDER_TIMEOUT = 120
+RENDER_POOL = None
+if EXEC_MODE == "process":
+    if BACKEND != "python":
+        raise RuntimeError("FILMSIM_EXEC_MODE=process needs FILMSIM_BACKEND=python")
+    from render_pool import RenderPool
+    RENDER_POOL = RenderPool(
+        processes=RENDER_PROCESSES,
+        max_tasks=RENDER_MAX_TASKS,
+        mem_limit_mb=RENDER_MEM_LIMIT_MB,
+        cache_dir=LUT_CACHE_DIR,
+        cache_mb=max(1, LUT_CACHE_MB // RENDER_PROCESSES),
+        exiftool_timeout=EXIFTOOL_TIMEOUT if EXIFTOOL is not None else None,
+    )
+    atexit.register(RENDER_POOL.close)
+
 PAGE_SIZE = 12
 INTENSITIES = [0.25, 0.50, 0.75, 1.00]
-CATEGORY_ALL = "All"
-CATEGORY_UNCATEGORIZED = "Uncategorized"
+
+# LUT catalog: built once, then refreshed by polling directory mtimes
+from lut_index import LutIndex, CATEGORY_ALL
+LUT_POLL_SECONDS = float(os.environ.get("FILMSIM_LUT_POLL", "30"))
+LUT_INDEX = LutIndex(LUT_DIR, ids_path=os.path.join(WORK_DIR, "lut_ids.json"))
+LUT_INDEX.start_polling(LUT_POLL_SECONDS)
 
 # Limit concurrency: 1 worker is safest on an RPi/server.
-WORKERS = int(os.environ.get("FILMSIM_WORKERS", "1"))
+# In process mode each worker thread just feeds the pool, so match its size.
+WORKERS = int(os.environ.get("FILMSIM_WORKERS", str(RENDER_PROCESSES if RENDER_POOL else 1)))
 
 # database
-from filmsim_db import FilmSimDB
+from filmsim_db import CachedFilmSimDB
 DB_PATH = os.path.join(BASE, "filmsim.db")
-db = FilmSimDB(DB_PATH)
+DB_FLUSH_SECONDS = float(os.environ.get("FILMSIM_DB_FLUSH", "5"))
+db = CachedFilmSimDB(DB_PATH, flush_interval=DB_FLUSH_SECONDS)
+atexit.register(db.close)
 
 FREE_DAILY_LIMIT = 5 #limits for non-premium users
 PREMIUM_PLANS = {
@@ -62,17 +120,84 @@ PREMIUM_PLANS = {
 # If False, keep last input per user so they can try multiple LUTs quickly.
 DELETE_INPUT_AFTER_PROCESS = os.environ.get("FILMSIM_DELETE_INPUT", "0") == "1"
 
-bot = telebot.TeleBot(TOKEN)
+# Handlers block on Bot API calls (and uploads), so TeleBot's default of 2
+# handler threads lets one slow send stall everyone's button presses.
+HANDLER_THREADS = int(os.environ.get("FILMSIM_HANDLER_THREADS", "32"))
+
+bot = telebot.TeleBot(TOKEN, num_threads=HANDLER_THREADS)
+
+# per-user browsing sessions: bounded (TTL + LRU), persisted in filmsim.db
+from session_store import SessionStore
+SESSION_TTL = float(os.environ.get("FILMSIM_SESSION_TTL", "86400"))
+SESSION_MAX = int(os.environ.get("FILMSIM_SESSION_MAX", "5000"))
+SESSIONS = SessionStore(
+    DB_PATH if os.environ.get("FILMSIM_SESSION_PERSIST", "1") == "1" else None,
+    ttl=SESSION_TTL, max_sessions=SESSION_MAX,
+)
+atexit.register(SESSIONS.close)
 
-# per-user state
-STATE = {}
 # per-user lock to prevent stacking jobs
 USER_BUSY = set()
+# handlers run on many threads and a double tap arrives in one getUpdates batch:
+# test-and-add on the busy sets must be one step
+BUSY_LOCK = threading.Lock()
 
-# job queues (premium-first with fairness)
+
+def claim(busy: set, uid: int) -> bool:
+    """Add uid to a busy set; False if it was already there."""
+    with BUSY_LOCK:
+        if uid in busy:
+            return False
+        busy.add(uid)
+        return True
+
+
+# job scheduler: weighted-fair across tiers (premium-first), round-robin across users.
+# Jobs are persisted in filmsim.db so a restart doesn't drop the queue.
+from job_scheduler import JobScheduler
+from job_store import JobStore
 Job = dict
-JOB_Q_PREMIUM: "queue.Queue[Job]" = queue.Queue(maxsize=200)
-JOB_Q_FREE: "queue.Queue[Job]" = queue.Queue(maxsize=200)
+PREMIUM_WEIGHT = int(os.environ.get("FILMSIM_PREMIUM_WEIGHT", "3"))
+FREE_WEIGHT = int(os.environ.get("FILMSIM_FREE_WEIGHT", "1"))
+JOB_STORE = JobStore(DB_PATH)
+atexit.register(JOB_STORE.flush)
+SCHEDULER = JobScheduler(
+    {"premium": PREMIUM_WEIGHT, "free": FREE_WEIGHT}, maxsize=200, workers=WORKERS, store=JOB_STORE
+)
+
+# previews: small renders on their own lighter queue, free of quota (python backend only)
+PREVIEW_ENABLED = BACKEND == "python" and os.environ.get("FILMSIM_PREVIEW", "1") == "1"
+PREVIEW_WORKERS = int(os.environ.get("FILMSIM_PREVIEW_WORKERS", "1"))
+PREVIEW_Q: "queue.Queue[Job]" = queue.Queue(maxsize=50)
+PREVIEW_BUSY = set()
+
+
+# uploads: streamed + hashed into a content-addressed store, users' in.* are hard links
+from ingest import InputStore, telegram_file_chunks
+INPUT_STORE = InputStore(os.path.join(WORK_DIR, "store"))
+
+# work/<uid> + store disk budget; idle inputs are unreachable once their session expires
+from janitor import Janitor
+JANITOR_SECONDS = int(os.environ.get("FILMSIM_JANITOR_SECONDS", "600"))
+WORK_BUDGET_MB = int(os.environ.get("FILMSIM_WORK_BUDGET_MB", "2048"))
+INPUT_MAX_AGE = float(os.environ.get("FILMSIM_INPUT_MAX_AGE", str(SESSION_TTL)))
+
+
+# finished exports keyed by (input hash, LUT id + mtime, intensity), with Telegram file_ids
+from export_cache import ExportCache
+EXPORT_CACHE_MB = int(os.environ.get("FILMSIM_EXPORT_CACHE_MB", "512"))
+EXPORT_CACHE = ExportCache(os.path.join(WORK_DIR, "exports"), max_bytes=EXPORT_CACHE_MB * 1024 * 1024) if EXPORT_CACHE_MB > 0 else None
+if EXPORT_CACHE is not None:
+    atexit.register(EXPORT_CACHE.close)
+
+
+# per-job stage timings (batched, async) for /stats
+from telemetry import Telemetry
+from keyboards import KeyboardCache
+from album import AlbumCollector
+TELEMETRY = Telemetry(os.path.join(BASE, "filmsim_telemetry.db"))
+atexit.register(TELEMETRY.flush)
+ADMIN_IDS = {int(x) for x in os.environ.get("FILMSIM_ADMIN_IDS", "").replace(" ", "").split(",") if x}
 
 
 def user_dir(user_id: int) -> str:
@@ -82,34 +207,45 @@ def user_dir(user_id: int) -> str:
 
 
 def list_luts():
-    out = []
-    for root, _, files in os.walk(LUT_DIR):
-        for f in files:
-            if f.lower().endswith(".cube"):
-                rel = os.path.relpath(os.path.join(root, f), LUT_DIR).replace("\\", "/")
-                out.append(rel)
-    return sorted(out)
+    return LUT_INDEX.all()
 
 
-def list_categories():
-    cats = set()
-    for rel in list_luts():
-        if "/" in rel:
-            cats.add(rel.split("/", 1)[0])
-        else:
-            cats.add(CATEGORY_UNCATEGORIZED)
-    out = [CATEGORY_ALL] + sorted(cats)
-    return out
+def list_luts_by_category(category: str):
+    return LUT_INDEX.by_category(category)
 
 
-def list_luts_by_category(category: str):
-    all_luts = list_luts()
-    if category == CATEGORY_ALL:
-        return all_luts
-    if category == CATEGORY_UNCATEGORIZED:
-        return [rel for rel in all_luts if "/" not in rel]
-    prefix = category.rstrip("/") + "/"
-    return [rel for rel in all_luts if rel.startswith(prefix)]
+def ingest_upload(file_id: str, file_unique_id: str, ext: str, in_path: str) -> str:
+    """Fetch an upload into in_path (streamed, deduplicated). Returns its content hash."""
+    digest = INPUT_STORE.link_known(file_unique_id, in_path)
+    if digest:
+        return digest
+    info = bot.get_file(file_id)
+    digest, _ = INPUT_STORE.ingest(telegram_file_chunks(TOKEN, info.file_path), ext, in_path, file_unique_id)
+    return digest
+
+
+def janitor_protected() -> set:
+    """Paths the janitor must not touch: inputs of queued/running jobs, dirs of users with work in flight."""
+    paths = JOB_STORE.active_paths()
+    paths.update(os.path.join(WORK_DIR, str(uid)) for uid in USER_BUSY | PREVIEW_BUSY)
+    return paths
+
+
+JANITOR = Janitor(WORK_DIR, INPUT_STORE, max_bytes=WORK_BUDGET_MB * 1024 * 1024, max_age=INPUT_MAX_AGE,
+                  protected=janitor_protected)
+
+
+def janitor_loop():
+    while True:
+        time.sleep(JANITOR_SECONDS)
+        try:
+            r = JANITOR.run()
+            if r["reclaimed"] or r["evicted"]:
+                print(f"janitor: reclaimed {r['reclaimed']} bytes, evicted {r['evicted']} inputs "
+                      f"({r['expired']} expired), work dir {r['used']}/{r['budget']} bytes")
+            TELEMETRY.record_disk(r["reclaimed"], r["evicted"], r["used"], r["budget"])
+        except Exception as e:
+            print(f"janitor failed: {e}")
 
 
 def safe_lut_abs(rel):
@@ -122,53 +258,8 @@ def safe_lut_abs(rel):
     return abs_path
 
 
-def kb_luts(luts, page, show_back=False):
-    total = len(luts)
-    pages = max(1, math.ceil(total / PAGE_SIZE))
-    page = max(0, min(page, pages - 1))
-
-    kb = types.InlineKeyboardMarkup(row_width=1)
-    start = page * PAGE_SIZE
-    end = min(total, start + PAGE_SIZE)
-
-    for rel in luts[start:end]:
-        display = rel[:-5] if rel.lower().endswith(".cube") else rel #strip extension, looks nasty in menu
-        label = display if len(display) <= 44 else ("…" + display[-43:])
-        kb.add(types.InlineKeyboardButton(label, callback_data=f"lut|{page}|{rel}"))
-
-    nav = []
-    if page > 0:
-        nav.append(types.InlineKeyboardButton("⬅ Prev", callback_data=f"page|{page-1}"))
-    nav.append(types.InlineKeyboardButton(f"Page {page+1}/{pages}", callback_data="noop"))
-    if page < pages - 1:
-        nav.append(types.InlineKeyboardButton("Next ➡", callback_data=f"page|{page+1}"))
-    kb.row(*nav)
-    if show_back:
-        kb.row(types.InlineKeyboardButton("⬅ Categories", callback_data="cats|0"))
-    return kb
-
-
-def kb_categories(cats, page):
-    total = len(cats)
-    pages = max(1, math.ceil(total / PAGE_SIZE))
-    page = max(0, min(page, pages - 1))
-
-    kb = types.InlineKeyboardMarkup(row_width=1)
-    start = page * PAGE_SIZE
-    end = min(total, start + PAGE_SIZE)
-
-    for cat in cats[start:end]:
-        label = cat if len(cat) <= 44 else ("…" + cat[-43:])
-        kb.add(types.InlineKeyboardButton(label, callback_data=f"cat|{page}|{cat}"))
-
-    nav = []
-    if page > 0:
-        nav.append(types.InlineKeyboardButton("⬅ Prev", callback_data=f"catpage|{page-1}"))
-    nav.append(types.InlineKeyboardButton(f"Page {page+1}/{pages}", callback_data="noop"))
-    if page < pages - 1:
-        nav.append(types.InlineKeyboardButton("Next ➡", callback_data=f"catpage|{page+1}"))
-    kb.row(*nav)
-    return kb
+# browsing keyboards, pre-rendered per catalog version (see keyboards.py)
+KEYBOARDS = KeyboardCache(LUT_INDEX, page_size=PAGE_SIZE, sheet_button=PREVIEW_ENABLED)
 
 
 def kb_intensity():
@@ -178,6 +269,19 @@ def kb_intensity():
     return kb
 
 
+def kb_preview(lut_rel: str, intensity: str):
+    kb = types.InlineKeyboardMarkup(row_width=4)
+    lut_id = LUT_INDEX.id_of(lut_rel)
+    if lut_id is not None:
+        kb.row(types.InlineKeyboardButton(f"✅ Export @ {float(intensity):.2f}", callback_data=f"exp|{lut_id}|{intensity}"))
+    others = [
+        types.InlineKeyboardButton(f"👁 {v:.2f}", callback_data=f"int|{v:.2f}")
+        for v in INTENSITIES if f"{v:.2f}" != intensity
+    ]
+    kb.add(*others)
+    return kb
+
+
 def cleanup_user_outputs(uid: int):
     """Keep the folder tidy: remove stale outputs, temp files."""
     d = user_dir(uid)
@@ -190,39 +294,193 @@ def cleanup_user_outputs(uid: int):
             pass
 
 
-def get_next_job(premium_streak: int, premium_quota: int = 3, timeout: float = 0.2):
+def render_export(in_path: str, lut_path: str, out_path: str, intensity, max_side=None, max_bytes=None) -> dict:
     """
-    Return (job, new_premium_streak). Enforces: do up to `premium_quota` premium jobs,
-    then allow 1 free job if available.
+    Apply the LUT with the configured backend. Returns per-stage seconds. Raises on failure.
+    max_side downscales before the LUT is applied, max_bytes size-targets the
+    JPEG (python backend only; gmic renders full size at its own quality).
     """
-    try_premium_first = premium_streak < premium_quota
+    if RENDER_POOL is not None:
+        return RENDER_POOL.render(in_path, lut_path, out_path, float(intensity), timeout=RENDER_TIMEOUT,
+                                  max_side=max_side, max_bytes=max_bytes)
+    if BACKEND == "python":
+        t0 = time.perf_counter()
+        lut = LUT_CACHE.get(lut_path)
+        timings = {"lut_load": time.perf_counter() - t0}
+        lut_engine.render_file(in_path, lut_path, out_path, float(intensity), lut=lut, exiftool=EXIFTOOL, timings=timings,
+                                max_side=max_side, max_bytes=max_bytes)
+        return timings
+    t0 = time.perf_counter()
+    subprocess.run(
+        [SCRIPT, in_path, lut_path, out_path, str(intensity)],
+        check=True,
+        timeout=RENDER_TIMEOUT,
+    )
+    return {"render": time.perf_counter() - t0}
 
-    if try_premium_first:
-        try:
-            return JOB_Q_PREMIUM.get(timeout=timeout), premium_streak + 1
-        except queue.Empty:
-            pass
-        try:
-            return JOB_Q_FREE.get(timeout=timeout), 0
-        except queue.Empty:
-            return None, premium_streak
-    else:
-        try:
-            return JOB_Q_FREE.get(timeout=timeout), 0
-        except queue.Empty:
-            pass
+
+def render_batch(items: list, lut_path: str, intensity, max_side=None, max_bytes=None) -> list:
+    """
+    render_export for an album's (in_path, out_path) pairs, one LUT. The python
+    backends pipeline decode/render/encode across the photos (and split them
+    over the render pool); gmic renders them one by one.
+    Returns per-photo stage timings, in order.
+    """
+    if RENDER_POOL is not None:
+        return RENDER_POOL.render_batch(items, lut_path, float(intensity), timeout=RENDER_TIMEOUT * len(items),
+                                        max_side=max_side, max_bytes=max_bytes)
+    if BACKEND == "python":
+        t0 = time.perf_counter()
+        lut = LUT_CACHE.get(lut_path)
+        lut_load = time.perf_counter() - t0
+        timings = lut_engine.render_files(items, lut_path, float(intensity), lut=lut, exiftool=EXIFTOOL,
+                                          max_side=max_side, max_bytes=max_bytes)
+        timings[0]["lut_load"] = lut_load
+        return timings
+    return [render_export(in_path, lut_path, out_path, intensity) for in_path, out_path in items]
+
+
+MAX_PHOTO_BYTES = 10 * 1024 * 1024  # 10MB
+
+# Telegram recompresses send_photo images to ~2560px on the long edge anyway,
+# so only premium document (full quality) exports render at full resolution.
+PHOTO_MAX_SIDE = int(os.environ.get("FILMSIM_PHOTO_MAX_SIDE", "2560"))
+
+
+def target_max_side(is_premium: bool, source: str):
+    """Long edge to render at for this delivery, or None for full resolution."""
+    if is_premium and source == "document":
+        return None
+    return PHOTO_MAX_SIDE
+
+
+def deliver_export(chat_id: int, path: str, caption: str):
+    """Send a finished export. Returns (telegram file_id, "photo" | "document")."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size <= MAX_PHOTO_BYTES:
+            msg = bot.send_photo(chat_id, f, caption=caption)
+            return msg.photo[-1].file_id, "photo"
+        # Send as file to bypass the 10MB photo limit (keeps quality)
+        msg = bot.send_document(chat_id, f, caption=caption, visible_file_name="filmsimbotEXPORT.jpg")
+        return msg.document.file_id, "document"
+
+
+def deliver_album(chat_id: int, file_ids: list, paths: list, kind: str, caption: str) -> list:
+    """
+    Send an album's exports as one media group, each by Telegram file_id if
+    known, else from its path. Returns the file_ids of the sent items, in order.
+    """
+    media_cls = types.InputMediaPhoto if kind == "photo" else types.InputMediaDocument
+    files, group = [], []
+    try:
+        for i, (file_id, path) in enumerate(zip(file_ids, paths)):
+            if file_id:
+                media = file_id
+            else:
+                files.append(open(path, "rb"))
+                media = types.InputFile(files[-1], file_name=f"filmsimbotEXPORT_{i + 1}.jpg")
+            group.append(media_cls(media, caption=caption if i == 0 else None))
+        msgs = bot.send_media_group(chat_id, group)
+    finally:
+        for f in files:
+            f.close()
+    return [m.photo[-1].file_id if kind == "photo" else m.document.file_id for m in msgs]
+
+
+def export_album(job: dict, lut_rel: str, lut_path: str, caption: str, timings: dict) -> str:
+    """
+    Render an album with one LUT as a single batch and deliver it as one
+    media group. Photos already in the export cache aren't rendered again.
+    Adds stage timings (summed over the photos) to `timings`. Returns the
+    telemetry outcome.
+    """
+    album = job["album"]
+    intensity = job["intensity"]
+    max_side = job.get("max_side")
+    lut_id = LUT_INDEX.id_of(lut_rel)
+    lut_mtime = os.stat(lut_path).st_mtime_ns
+    keys = [
+        EXPORT_CACHE.key(in_hash, lut_id, lut_mtime, intensity, variant=str(max_side or "full"))
+        if EXPORT_CACHE is not None and in_hash else None
+        for _, in_hash in album
+    ]
+    # Telegram only groups photos with photos and documents with documents
+    kind = "photo" if max_side else "document"
+    file_ids, paths = [None] * len(album), [None] * len(album)
+    outs = []
+    try:
+        for _ in range(2):  # a second pass only if an export turned out too big for a photo
+            todo = []
+            for i, key in enumerate(keys):
+                if file_ids[i] or paths[i]:
+                    continue
+                hit = EXPORT_CACHE.get(key) if key else None
+                if hit and hit.file_id and hit.kind == kind:
+                    file_ids[i] = hit.file_id
+                elif hit and hit.path:
+                    paths[i] = hit.path
+                else:
+                    todo.append(i)
+
+            if todo:
+                d = user_dir(job["user_id"])
+                pairs = [(album[i][0], os.path.join(d, f"out_{i}.jpg")) for i in todo]
+                outs += [out for _, out in pairs]
+                max_bytes = MAX_PHOTO_BYTES if max_side else None
+                for t in render_batch(pairs, lut_path, intensity, max_side, max_bytes):
+                    t.pop("encoder", None)
+                    for stage, v in t.items():
+                        timings[stage] = timings.get(stage, 0.0) + v
+                for i, (_, out) in zip(todo, pairs):
+                    paths[i] = EXPORT_CACHE.put(keys[i], out) if keys[i] else out
+
+            if kind == "photo" and any(p and os.path.getsize(p) > MAX_PHOTO_BYTES for p in paths):
+                kind = "document"
+                file_ids = [None] * len(album)  # cached photo file_ids can't join a document group
+                continue
+            break
+
+        t0 = time.perf_counter()
         try:
-            return JOB_Q_PREMIUM.get(timeout=timeout), premium_streak + 1
-        except queue.Empty:
-            return None, premium_streak
+            sent = deliver_album(job["chat_id"], file_ids, paths, kind, caption)
+        except telebot.apihelper.ApiTelegramException:
+            for key, file_id in zip(keys, file_ids):
+                if file_id:
+                    EXPORT_CACHE.forget_file_id(key)  # the next try uploads the files
+            raise
+        timings["upload"] = time.perf_counter() - t0
+        for key, file_id in zip(keys, sent):
+            if key:
+                EXPORT_CACHE.set_file_id(key, file_id, kind)
+        return "ok" if outs else "cached"
+    finally:
+        for out in outs:
+            try:
+                if os.path.exists(out):
+                    os.remove(out)
+            except Exception:
+                pass
+
+
+def resend_cached(chat_id: int, hit, caption: str) -> bool:
+    """Re-send a cached export by Telegram file_id (no render, no upload)."""
+    try:
+        if hit.kind == "document":
+            bot.send_document(chat_id, hit.file_id, caption=caption)
+        else:
+            bot.send_photo(chat_id, hit.file_id, caption=caption)
+        return True
+    except telebot.apihelper.ApiTelegramException as e:
+        print(f"cached file_id rejected ({e}); re-sending file")
+        EXPORT_CACHE.forget_file_id(hit.key)
+        return False
 
 
 def worker_loop(n: int):
-    premium_streak = 0
     while True:
-        job, premium_streak = get_next_job(premium_streak)
-        if job is None:
-            continue
+        job = SCHEDULER.get()
+        started = time.monotonic()
 
         user_id = job["user_id"]
         chat_id = job["chat_id"]
@@ -230,42 +488,63 @@ def worker_loop(n: int):
         in_path = job["in_path"]
         lut_rel = job["lut_rel"]
         intensity = job["intensity"]
-        job_is_premium = job.get("is_premium", False)
+        max_side = job.get("max_side")
         out_path = os.path.join(user_dir(user_id), "out.jpg")
+        committed = False
+        outcome = "error"
+        queue_depth = SCHEDULER.qsize()
+        timings = {"queue_wait": max(0.0, time.time() - job.get("enqueued_at", time.time()))}
+        encoder = None
 
         try:
             cleanup_user_outputs(user_id)
 
             lut_path = safe_lut_abs(lut_rel)
 
-            subprocess.run(
-                [SCRIPT, in_path, lut_path, out_path, str(intensity)],
-                check=True,
-                timeout=120,
-            )
-
             lut_name = lut_rel[:-5] if lut_rel.lower().endswith(".cube") else lut_rel
             caption = f"{lut_name} recipe @ {float(intensity):.2f}"
 
-
-
-            
-            MAX_PHOTO_BYTES = 10 * 1024 * 1024  # 10MB
-            size = os.path.getsize(out_path)
-
-            with open(out_path, "rb") as f:
-                if size <= MAX_PHOTO_BYTES:
-                    bot.send_photo(chat_id, f, caption=caption)
+            if job.get("album"):
+                outcome = export_album(job, lut_rel, lut_path, caption, timings)
+            else:
+                cache_key = None
+                if EXPORT_CACHE is not None and job.get("in_hash"):
+                    cache_key = EXPORT_CACHE.key(
+                        job["in_hash"], LUT_INDEX.id_of(lut_rel), os.stat(lut_path).st_mtime_ns, intensity,
+                        variant=str(max_side or "full"),
+                    )
+                hit = EXPORT_CACHE.get(cache_key) if cache_key else None
+
+                t0 = time.perf_counter()
+                if hit and hit.file_id and resend_cached(chat_id, hit, caption):
+                    outcome = "cached"
+                    timings["upload"] = time.perf_counter() - t0
                 else:
-                    # Send as file to bypass the 10MB photo limit (keeps quality)
-                    bot.send_document(chat_id, f, caption=caption, visible_file_name="filmsimbotEXPORT.jpg")  
-            
-            # ---- COUNT A SUCCESSFUL EXPORT (ADD THIS) ----
-            db.increment_usage(user_id)
+                    if hit and hit.path:
+                        send_path = hit.path
+                        outcome = "cached"
+                    else:
+                        # exports delivered as photos are encoded to fit the photo limit in
+                        # one go; full resolution ones are meant to go out as documents
+                        max_bytes = MAX_PHOTO_BYTES if max_side else None
+                        timings.update(render_export(in_path, lut_path, out_path, intensity, max_side, max_bytes))
+                        encoder = timings.pop("encoder", None)
+                        send_path = EXPORT_CACHE.put(cache_key, out_path) if cache_key else out_path
+                        outcome = "ok"
+
+                    t0 = time.perf_counter()
+                    file_id, kind = deliver_export(chat_id, send_path, caption)
+                    timings["upload"] = time.perf_counter() - t0
+                    if cache_key:
+                        EXPORT_CACHE.set_file_id(cache_key, file_id, kind)
+
+            # ---- COUNT A SUCCESSFUL EXPORT: reserved slot → counted ----
+            db.commit_export(user_id, job.get("quota_day"), job.get("quota_count", 1))
+            committed = True
 
             bot.edit_message_text("Done ✅", chat_id, msg_id)
 
-        except subprocess.TimeoutExpired:
+        except (subprocess.TimeoutExpired, multiprocessing.TimeoutError):
             bot.edit_message_text("Error: processing timed out.", chat_id, msg_id)
         except subprocess.CalledProcessError as e:
             bot.edit_message_text(f"Error: processing failed ({e.returncode}).", chat_id, msg_id)
@@ -281,18 +560,101 @@ def worker_loop(n: int):
 
             # optional: remove input after processing
             if DELETE_INPUT_AFTER_PROCESS:
-                try:
-                    if os.path.exists(in_path):
-                        os.remove(in_path)
-                except Exception:
-                    pass
-
+                for p in [in_path] + [p for p, _ in job.get("album") or ()]:
+                    try:
+                        if os.path.exists(p):
+                            os.remove(p)
+                    except Exception:
+                        pass
+
+            if not committed:
+                db.release_export(user_id, job.get("quota_day"), job.get("quota_count", 1))
+                outcome = "error"
+            timings["total"] = timings["queue_wait"] + (time.monotonic() - started)
+            TELEMETRY.record(timings, outcome=outcome, queue_depth=queue_depth, tier=job.get("tier"),
+                             encoder=encoder, album=len(job.get("album") or ()) or None)
             USER_BUSY.discard(user_id)
-            if job_is_premium:
-                JOB_Q_PREMIUM.task_done()
-            else:
-                JOB_Q_FREE.task_done()
+            SCHEDULER.task_done(job, time.monotonic() - started)
+
+
+def warm_lut_cache():
+    n = LUT_CACHE.warm(os.path.join(LUT_DIR, rel) for rel in list_luts())
+    print(f"LUT cache warmed: {n} LUTs, {LUT_CACHE.stats()}")
+
+
+if LUT_CACHE is not None:
+    threading.Thread(target=warm_lut_cache, daemon=True).start()
+
+def send_contact_sheet(job: dict):
+    rels = job["luts"]
+    luts = []
+    for rel in rels:
+        label = rel[:-5] if rel.lower().endswith(".cube") else rel
+        luts.append((label.rsplit("/", 1)[-1], LUT_CACHE.get(safe_lut_abs(rel))))
+    data = lut_engine.render_contact_sheet(job["in_path"], luts)
+    bot.send_photo(
+        job["chat_id"],
+        data,
+        caption=f"{job['category']} — page {job['page'] + 1} ({len(luts)} looks)",
+    )
+
+
+def preview_loop(n: int):
+    while True:
+        job = PREVIEW_Q.get()
+        user_id = job["user_id"]
+        chat_id = job["chat_id"]
+        if job.get("kind") == "sheet":
+            try:
+                send_contact_sheet(job)
+            except Exception as e:
+                bot.send_message(chat_id, f"Contact sheet failed: {e}")
+            finally:
+                PREVIEW_BUSY.discard(user_id)
+                PREVIEW_Q.task_done()
+            continue
+
+        lut_rel = job["lut_rel"]
+        intensity = job["intensity"]
+        try:
+            lut = LUT_CACHE.get(safe_lut_abs(lut_rel))
+            data = lut_engine.render_preview(job["in_path"], lut, float(intensity))
+            lut_name = lut_rel[:-5] if lut_rel.lower().endswith(".cube") else lut_rel
+            bot.send_photo(
+                chat_id,
+                data,
+                caption=f"Preview: {lut_name} @ {float(intensity):.2f}",
+                reply_markup=kb_preview(lut_rel, intensity),
+            )
+        except Exception as e:
+            bot.send_message(chat_id, f"Preview failed: {e}")
+        finally:
+            PREVIEW_BUSY.discard(user_id)
+            PREVIEW_Q.task_done()
+
 
+if PREVIEW_ENABLED:
+    for i in range(PREVIEW_WORKERS):
+        threading.Thread(target=preview_loop, args=(i,), daemon=True).start()
+
+threading.Thread(target=janitor_loop, daemon=True).start()
+
+def recover_jobs():
+    """Re-queue exports that were queued/running when the bot last stopped."""
+    jobs = JOB_STORE.recover()
+    if not jobs:
+        return
+    SCHEDULER.restore(jobs)
+    for job in jobs:
+        USER_BUSY.add(job["user_id"])
+        try:
+            bot.edit_message_text("Queued… (resumed after restart)", job["chat_id"], job["status_msg_id"])
+        except Exception:
+            pass
+    print(f"recovered {len(jobs)} queued jobs")
+
+
+recover_jobs()
 
 # start workers
 for i in range(WORKERS):
@@ -307,16 +669,18 @@ def start(m):
         "Send me a photo, or attach an image as a file for full quality.\n\n"
         "How to send:\n"
         "• Photo – quick preview (Telegram may compress)\n"
-        "• File (📎 → File) – full-resolution images\n\n"
+        "• File (📎 → File) – full-resolution images\n"
+        "• Album – one recipe applied to every photo in it\n\n"
         "Commands:\n"
         "/recipes  – browse film look recipes\n"
+        "/sheet    – contact sheet of the current recipe page\n"
         "/clear    – forget current photo\n"
         "/usage    – today’s usage\n"
     )
 @bot.message_handler(commands=["clear"])
 def clear(m):
     uid = m.from_user.id
-    STATE.pop(uid, None)
+    SESSIONS.pop(uid)
     USER_BUSY.discard(uid)
     # tidy user folder but keep LUTs external
     d = user_dir(uid)
@@ -327,6 +691,7 @@ def clear(m):
                 os.remove(p)
         except Exception:
             pass
+    shutil.rmtree(album_dir(uid), ignore_errors=True)
     bot.reply_to(m, "Cleared your current selection.")
 
 
@@ -340,6 +705,15 @@ def usage(m):
         bot.reply_to(m, f"Free exports today: {used}/{FREE_DAILY_LIMIT}\nUpgrade: /premium")
 
 
+@bot.message_handler(commands=["stats"])
+def stats(m):
+    if m.from_user.id not in ADMIN_IDS:
+        return
+    parts = (m.text or "").split()
+    hours = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 24
+    bot.reply_to(m, TELEMETRY.report(max(1, min(hours, 24 * 14))))
+
+
 @bot.message_handler(commands=["premium"])
 def premium(m):
     plan = PREMIUM_PLANS["premium_30d"]
@@ -382,11 +756,23 @@ def on_successful_payment(m):
 @bot.message_handler(commands=["recipes"])
 def recipes(m):
     uid = m.from_user.id
-    st = STATE.setdefault(uid, {})
-    st["cats"] = list_categories()
-    st["cat"] = CATEGORY_ALL
-    st["cat_page"] = 0
-    bot.send_message(m.chat.id, "Pick a category:", reply_markup=kb_categories(st["cats"], 0))
+    st = SESSIONS.setdefault(uid)
+    st.cat = CATEGORY_ALL
+    st.cat_page = 0
+    bot.send_message(m.chat.id, "Pick a category:", reply_markup=KEYBOARDS.categories(0))
+
+
+@bot.message_handler(commands=["sheet"])
+def sheet(m):
+    uid = m.from_user.id
+    st = SESSIONS.get(uid)
+    if not PREVIEW_ENABLED:
+        bot.reply_to(m, "Contact sheets are not available right now.")
+        return
+    if not st or not st.in_path:
+        bot.reply_to(m, "Send a photo and pick a category first.")
+        return
+    bot.reply_to(m, enqueue_sheet(uid, m.chat.id, st, st.cat, st.page))
 
 
 @bot.message_handler(content_types=["photo"])
@@ -395,27 +781,19 @@ def photo(m):
 
     # largest version
     p = m.photo[-1]
-    info = bot.get_file(p.file_id)
-    data = bot.download_file(info.file_path)
+
+    if m.media_group_id:
+        collect_album_item(m, p.file_id, p.file_unique_id, ".jpg", "photo")
+        return
 
     # keep tidy: overwrite user input
     d = user_dir(uid)
     in_path = os.path.join(d, "in.jpg")
-    with open(in_path, "wb") as f:
-        f.write(data)
-
-    l = list_luts()
-    STATE[uid] = {
-        "in_path": in_path,
-        "cats": list_categories(),
-        "cat": CATEGORY_ALL,
-        "cat_page": 0,
-        "luts": l,
-        "page": 0,
-        "lut_rel": None,
-    }
+    in_hash = ingest_upload(p.file_id, p.file_unique_id, ".jpg", in_path)
 
-    bot.send_message(m.chat.id, "Photo received. Pick a category:", reply_markup=kb_categories(STATE[uid]["cats"], 0))
+    SESSIONS.new(uid, in_path=in_path, in_hash=in_hash, source="photo")
+
+    bot.send_message(m.chat.id, "Photo received. Pick a category:", reply_markup=KEYBOARDS.categories(0))
 
 @bot.message_handler(content_types=["document"])
 def document(m):
@@ -431,157 +809,348 @@ def document(m):
         bot.reply_to(m, "Image too large (max 50MB).")
         return
   
-    info = bot.get_file(doc.file_id)
-    data = bot.download_file(info.file_path)
-
-    d = user_dir(uid)
     ext = os.path.splitext(doc.file_name or "")[1].lower()
     if ext not in (".jpg", ".jpeg", ".png"):
         ext = ".jpg"
 
+    if m.media_group_id:
+        collect_album_item(m, doc.file_id, doc.file_unique_id, ext, "document")
+        return
+
+    d = user_dir(uid)
     in_path = os.path.join(d, f"in{ext}")
-    with open(in_path, "wb") as f:
-        f.write(data)
-
-    STATE[uid] = {
-        "in_path": in_path,
-        "cats": list_categories(),
-        "cat": CATEGORY_ALL,
-        "cat_page": 0,
-        "luts": list_luts(),
-        "page": 0,
-        "lut_rel": None,
-    }
+    in_hash = ingest_upload(doc.file_id, doc.file_unique_id, ext, in_path)
+
+    SESSIONS.new(uid, in_path=in_path, in_hash=in_hash, source="document")
 
     bot.send_message(
         m.chat.id,
         "📎 Image received in full quality.\nPick a category:",
-        reply_markup=kb_categories(STATE[uid]["cats"], 0),
+        reply_markup=KEYBOARDS.categories(0),
     )
 
 
-@bot.callback_query_handler(func=lambda c: True)
-def cb(c):
+def album_dir(uid: int, group_id=None) -> str:
+    d = os.path.join(user_dir(uid), "album")
+    return os.path.join(d, str(group_id)) if group_id is not None else d
+
+
+def collect_album_item(m, file_id: str, file_unique_id: str, ext: str, source: str):
+    """Download one photo of an album; album_ready() runs once the whole group is in."""
+    uid = m.from_user.id
+    key = (uid, m.media_group_id)
+    if not ALBUMS.begin(key, chat_id=m.chat.id, source=source):
+        return  # more than Telegram allows in one album
+    try:
+        d = album_dir(uid, m.media_group_id)
+        os.makedirs(d, exist_ok=True)
+        # album files land below work/<uid>/, which leaves its mtime alone; the janitor
+        # goes by that mtime, so mark the user as active before the download starts
+        os.utime(user_dir(uid))
+        in_path = os.path.join(d, f"{m.message_id}{ext}")
+        in_hash = ingest_upload(file_id, file_unique_id, ext, in_path)
+    except Exception:
+        ALBUMS.cancel(key)
+        raise
+    ALBUMS.add(key, m.message_id, [in_path, in_hash])
+
+
+def album_ready(key, items: list, meta: dict):
+    uid, group_id = key
+    in_path, in_hash = items[0]
+    SESSIONS.new(uid, in_path=in_path, in_hash=in_hash, source=meta["source"],
+                 album=items if len(items) > 1 else None)
+
+    # keep tidy: drop earlier albums, unless an export may still be reading one
+    if uid not in USER_BUSY:
+        root = album_dir(uid)
+        for name in os.listdir(root):
+            if name != str(group_id):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    if len(items) > 1:
+        text = (f"🖼 Album of {len(items)} received. The recipe you export is applied to all of them "
+                "(previews show the first).\nPick a category:")
+    else:
+        text = "Photo received. Pick a category:"
+    bot.send_message(meta["chat_id"], text, reply_markup=KEYBOARDS.categories(0))
+
+
+# album photos arrive as separate messages; an album is complete after ALBUM_QUIET seconds of silence
+ALBUM_QUIET = float(os.environ.get("FILMSIM_ALBUM_QUIET", "1.5"))
+ALBUMS = AlbumCollector(album_ready, quiet=ALBUM_QUIET)
+
+
+def selected_lut(st):
+    """Relative path of the session's selected LUT, if it still exists."""
+    return LUT_INDEX.rel_of(st.lut_id) if st.lut_id is not None else None
+
+
+def enqueue_export(c, st, intensity: str):
+    """Reserve a quota slot per photo + queue a full-resolution export for the selected LUT."""
     uid = c.from_user.id
-    data = c.data or ""
 
-    if data == "noop":
-        bot.answer_callback_query(c.id)
+    # prevent a single user stacking jobs (claimed before the quota is touched)
+    if not claim(USER_BUSY, uid):
+        bot.answer_callback_query(c.id, "Still processing your last request…")
         return
 
-    st = STATE.get(uid)
-    if not st:
-        bot.answer_callback_query(c.id, "Send a photo first.")
+    lut_rel = selected_lut(st)
+    in_path = st.in_path
+    if not lut_rel:
+        USER_BUSY.discard(uid)
+        bot.answer_callback_query(c.id, "Pick a recipie first.")
+        return
+    if not in_path or not os.path.isfile(in_path):
+        USER_BUSY.discard(uid)
+        bot.answer_callback_query(c.id, "Send a photo again.")
         return
 
-    if data.startswith("page|"):
-        page = int(data.split("|", 1)[1])
-        st["page"] = page
-        bot.edit_message_reply_markup(
-            chat_id=c.message.chat.id,
-            message_id=c.message.message_id,
-            reply_markup=kb_luts(st.get("luts", []), page, show_back=True),
+    # ---- DAILY LIMIT: atomic check + reserve; committed by the worker on success ----
+    # every photo of an album is an export; free users get what's left of today's limit
+    album = st.album
+    try:
+        res = db.reserve_export(uid, FREE_DAILY_LIMIT, len(album) if album else 1)
+    except Exception:
+        USER_BUSY.discard(uid)
+        raise
+    if not res.allowed:
+        USER_BUSY.discard(uid)
+        bot.answer_callback_query(c.id, f"Daily limit reached ({res.used}/{res.limit}).")
+        bot.send_message(
+            c.message.chat.id,
+            "You’ve hit today’s free limit (5).\n"
+            "Upgrade to Premium for unlimited. (/premium)"
         )
-        bot.answer_callback_query(c.id)
         return
 
-    if data.startswith("catpage|"):
-        page = int(data.split("|", 1)[1])
-        st["cat_page"] = page
-        bot.edit_message_reply_markup(
-            chat_id=c.message.chat.id,
-            message_id=c.message.message_id,
-            reply_markup=kb_categories(st.get("cats", []), page),
-        )
-        bot.answer_callback_query(c.id)
+    # enqueue job
+    job_id = None
+    try:
+        if album and res.count < len(album):
+            bot.send_message(
+                c.message.chat.id,
+                f"Only {res.count} of the {len(album)} photos fit in today’s free limit "
+                f"({res.used}/{res.limit}); exporting the first {res.count}.\n"
+                "Upgrade to Premium for unlimited. (/premium)"
+            )
+            album = album[:res.count]
+            if len(album) == 1:
+                album = None  # a single photo: the plain export path (in_path is the first photo)
+        status = bot.send_message(c.message.chat.id, "Queued…")
+        is_premium = res.is_premium
+        if is_premium:
+            bot.send_message(c.message.chat.id, "⭐ Your export is being processed with priority.")
+        job_id = SCHEDULER.put({
+            "user_id": uid,
+            "is_premium": is_premium,
+            "chat_id": c.message.chat.id,
+            "status_msg_id": status.message_id,
+            "in_path": in_path,
+            "in_hash": st.in_hash,
+            "lut_rel": lut_rel,
+            "intensity": intensity,
+            "album": album,
+            "quota_day": res.day,
+            "quota_count": res.count,
+            "max_side": target_max_side(is_premium, st.source),
+            "enqueued_at": time.time(),
+        }, tier="premium" if is_premium else "free")
+        bot.answer_callback_query(c.id, "Queued")
+        pos, eta = SCHEDULER.position(job_id)
+        if pos > 1:
+            try:
+                bot.edit_message_text(f"Queued… #{pos} in line (~{math.ceil(eta)}s)", c.message.chat.id, status.message_id)
+            except Exception:
+                pass  # already picked up and edited by a worker
+    except queue.Full:
+        USER_BUSY.discard(uid)
+        db.release_export(uid, res.day, res.count)
+        bot.answer_callback_query(c.id, "Busy right now — try again in a minute.")
+        bot.send_message(c.message.chat.id, "Sever is busy. Premium users skip the line with priority processing. /premium")
+    except Exception:
+        if job_id is None:  # never queued: give the slot back
+            USER_BUSY.discard(uid)
+            db.release_export(uid, res.day, res.count)
+        raise
+
+
+def enqueue_sheet(uid: int, chat_id: int, st, category: str, page: int) -> str:
+    """Queue a contact sheet of one page of a category. Returns a status for the user."""
+    in_path = st.in_path
+    if not in_path or not os.path.isfile(in_path):
+        return "Send a photo again."
+    luts = list_luts_by_category(category)
+    start = max(0, page) * PAGE_SIZE
+    rels = luts[start:start + PAGE_SIZE]
+    if not rels:
+        return "No recipes on this page."
+    if not claim(PREVIEW_BUSY, uid):
+        return "Still rendering your last preview…"
+
+    try:
+        PREVIEW_Q.put_nowait({
+            "kind": "sheet",
+            "user_id": uid,
+            "chat_id": chat_id,
+            "in_path": in_path,
+            "luts": rels,
+            "category": category,
+            "page": page,
+        })
+    except queue.Full:
+        PREVIEW_BUSY.discard(uid)
+        return "Busy right now — try again in a minute."
+    return "Rendering contact sheet…"
+
+
+def enqueue_preview(c, st, intensity: str):
+    """Queue a small preview render. Previews don't count against quota."""
+    uid = c.from_user.id
+    lut_rel = selected_lut(st)
+    in_path = st.in_path
+    if not lut_rel:
+        bot.answer_callback_query(c.id, "Pick a recipie first.")
+        return
+    if not in_path or not os.path.isfile(in_path):
+        bot.answer_callback_query(c.id, "Send a photo again.")
+        return
+    if not claim(PREVIEW_BUSY, uid):
+        bot.answer_callback_query(c.id, "Still rendering your last preview…")
         return
 
-    if data.startswith("cats|"):
-        st["cat_page"] = int(data.split("|", 1)[1])
-        bot.edit_message_text(
-            "Pick a category:",
-            chat_id=c.message.chat.id,
-            message_id=c.message.message_id,
-            reply_markup=kb_categories(st.get("cats", []), st["cat_page"]),
-        )
+    try:
+        PREVIEW_Q.put_nowait({
+            "user_id": uid,
+            "chat_id": c.message.chat.id,
+            "in_path": in_path,
+            "lut_rel": lut_rel,
+            "intensity": intensity,
+        })
+        bot.answer_callback_query(c.id, "Rendering preview…")
+    except queue.Full:
+        PREVIEW_BUSY.discard(uid)
+        bot.answer_callback_query(c.id, "Busy right now — try again in a minute.")
+
+
+def stale_menu(c, text: str = "The recipe list changed. Pick a category:"):
+    bot.edit_message_text(
+        text,
+        chat_id=c.message.chat.id,
+        message_id=c.message.message_id,
+        reply_markup=KEYBOARDS.categories(0),
+    )
+    bot.answer_callback_query(c.id)
+
+
+def browse(c, st, data: str) -> bool:
+    """Category / LUT menu callbacks. Returns False if `data` isn't one."""
+    action, _, args = data.partition("|")
+    chat_id, msg_id = c.message.chat.id, c.message.message_id
+
+    if action == "page":
+        version, cat_no, page = map(int, args.split("|"))
+        markup = KEYBOARDS.luts(version, cat_no, page)
+        if markup is None:
+            stale_menu(c)
+            return True
+        st.page = page
+        bot.edit_message_reply_markup(chat_id=chat_id, message_id=msg_id, reply_markup=markup)
         bot.answer_callback_query(c.id)
-        return
+        return True
 
-    if data.startswith("cat|"):
-        _, page_str, cat = data.split("|", 2)
-        st["cat_page"] = int(page_str)
-        st["cat"] = cat
-        st["page"] = 0
-        st["luts"] = list_luts_by_category(cat)
-        bot.edit_message_text(
-            "Pick a filter:",
-            chat_id=c.message.chat.id,
-            message_id=c.message.message_id,
-            reply_markup=kb_luts(st.get("luts", []), 0, show_back=True),
-        )
-        bot.answer_callback_query(c.id, "Selected")
-        return
+    if action == "catpage":
+        st.cat_page = int(args)
+        bot.edit_message_reply_markup(chat_id=chat_id, message_id=msg_id, reply_markup=KEYBOARDS.categories(st.cat_page))
+        bot.answer_callback_query(c.id)
+        return True
 
-    if data.startswith("lut|"):
-        _, page_str, rel = data.split("|", 2)
-        st["page"] = int(page_str)
-        st["lut_rel"] = rel
+    if action == "cats":
+        st.cat_page = int(args)
+        bot.edit_message_text("Pick a category:", chat_id=chat_id, message_id=msg_id,
+                              reply_markup=KEYBOARDS.categories(st.cat_page))
+        bot.answer_callback_query(c.id)
+        return True
+
+    if action == "cat":
+        version, cat_no = map(int, args.split("|"))
+        cat = KEYBOARDS.category(version, cat_no)
+        if cat is None:
+            stale_menu(c)
+            return True
+        st.cat = cat
+        st.cat_page = cat_no // PAGE_SIZE
+        st.page = 0
+        bot.edit_message_text("Pick a filter:", chat_id=chat_id, message_id=msg_id,
+                              reply_markup=KEYBOARDS.luts(version, cat_no, 0))
+        bot.answer_callback_query(c.id, "Selected")
+        return True
+
+    if action == "lut":
+        page, lut_id = map(int, args.split("|"))
+        rel = LUT_INDEX.rel_of(lut_id)
+        if not rel:
+            bot.answer_callback_query(c.id, "That recipe is no longer available.")
+            return True
+        st.page = page
+        st.lut_id = lut_id
         bot.answer_callback_query(c.id, "Selected")
         rel_display = rel[:-5] if rel.lower().endswith(".cube") else rel
-        bot.send_message(c.message.chat.id, f"Selected filter:\n{rel_display}\n\nPick intensity:", reply_markup=kb_intensity())
+        prompt = "Pick intensity to preview:" if PREVIEW_ENABLED else "Pick intensity:"
+        bot.send_message(chat_id, f"Selected filter:\n{rel_display}\n\n{prompt}", reply_markup=kb_intensity())
+        return True
+
+    if action == "sheet":
+        version, cat_no, page = map(int, args.split("|"))
+        cat = KEYBOARDS.category(version, cat_no)
+        if cat is None:
+            bot.answer_callback_query(c.id, "The recipe list changed — pick the category again.")
+            return True
+        bot.answer_callback_query(c.id, enqueue_sheet(c.from_user.id, chat_id, st, cat, page))
+        return True
+
+    return False
+
+
+@bot.callback_query_handler(func=lambda c: True)
+def cb(c):
+    uid = c.from_user.id
+    data = c.data or ""
+
+    if data == "noop":
+        bot.answer_callback_query(c.id)
         return
 
-    if data.startswith("int|"):
-        # ---- DAILY LIMIT CHECK (ADD THIS) ----
-        allowed, used, limit = db.can_process(uid, FREE_DAILY_LIMIT)
-        if not allowed:
-            bot.answer_callback_query(c.id, f"Daily limit reached ({used}/{limit}).")
-            bot.send_message(
-                c.message.chat.id,
-                "You’ve hit today’s free limit (5).\n"
-                "Upgrade to Premium for unlimited. (/premium)"
-            )
-            return
-        # ---- END DAILY LIMIT CHECK ----
+    st = SESSIONS.get(uid)
+    if not st:
+        bot.answer_callback_query(c.id, "Send a photo first.")
+        return
 
-        # prevent a single user stacking jobs
-        if uid in USER_BUSY:
-            bot.answer_callback_query(c.id, "Still processing your last request…")
+    try:
+        if browse(c, st, data):
             return
+    except ValueError:
+        # callback data from a menu rendered by an older version of the bot
+        stale_menu(c)
+        return
 
+    if data.startswith("int|"):
         intensity = data.split("|", 1)[1]
-        lut_rel = st.get("lut_rel")
-        in_path = st.get("in_path")
-        if not lut_rel:
-            bot.answer_callback_query(c.id, "Pick a recipie first.")
-            return
-        if not in_path or not os.path.isfile(in_path):
-            bot.answer_callback_query(c.id, "Send a photo again.")
-            return
-
-        USER_BUSY.add(uid)
+        if PREVIEW_ENABLED:
+            enqueue_preview(c, st, intensity)
+        else:
+            enqueue_export(c, st, intensity)
+        return
 
-        # enqueue job
-        try:
-            status = bot.send_message(c.message.chat.id, "Queued…")
-            is_premium = db.is_premium(uid)
-            if is_premium:
-                bot.send_message(c.message.chat.id, "⭐ Your export is being processed with priority.")
-            target_q = JOB_Q_PREMIUM if is_premium else JOB_Q_FREE
-            target_q.put_nowait({
-                "user_id": uid,
-                "is_premium": is_premium,
-                "chat_id": c.message.chat.id,
-                "status_msg_id": status.message_id,
-                "in_path": in_path,
-                "lut_rel": lut_rel,
-                "intensity": intensity,
-            })
-            bot.answer_callback_query(c.id, "Queued")
-        except queue.Full:
-            USER_BUSY.discard(uid)
-            bot.answer_callback_query(c.id, "Busy right now — try again in a minute.")
-            bot.send_message(c.message.chat.id, "Sever is busy. Premium users skip the line with priority processing. /premium")
+    if data.startswith("exp|"):
+        # exp|<lut_id>|<intensity> from a preview: export exactly what was previewed
+        _, lut_id, intensity = data.split("|", 2)
+        rel = LUT_INDEX.rel_of(int(lut_id))
+        if not rel:
+            bot.answer_callback_query(c.id, "That recipe is no longer available.")
+            return
+        st.lut_id = int(lut_id)
+        enqueue_export(c, st, intensity)
         return
 
     bot.answer_callback_query(c.id, "Unknown action.")
@@ -589,6 +1158,8 @@ def cb(c):
 
 if __name__ == "__main__":
     print("filmsim_bot running…")
-    print("LUT_DIR:", LUT_DIR)
-    print("WORKERS:", WORKERS, "DELETE_INPUT_AFTER_PROCESS:", DELETE_INPUT_AFTER_PROCESS)
+    print("LUT_DIR:", LUT_DIR, f"({len(LUT_INDEX)} LUTs)")
+    print("BACKEND:", BACKEND, "EXEC_MODE:", EXEC_MODE)
+    print("WORKERS:", WORKERS, "DELETE_INPUT_AFTER_PROCESS:", DELETE_INPUT_AFTER_PROCESS,
+          "HANDLER_THREADS:", HANDLER_THREADS)
     bot.infinity_polling(timeout=30, long_polling_timeout=30)
@@ -4,20 +4,28 @@ filmsim_db.py — SQLite helpers for FilmSimBot
 
 Stores:
 - premium status (premium_until UTC)
-- daily usage counters
+- daily usage counters (+ slots reserved by queued exports)
+
+Each thread keeps one persistent connection (pragmas applied once, and
+sqlite3's per-connection statement cache actually gets reused).
 
 Usage:
     from filmsim_db import FilmSimDB
     db = FilmSimDB("/path/to/filmsim.db")
+
+    # or, for the bot: in-memory quota/premium cache with write-behind
+    from filmsim_db import CachedFilmSimDB
+    db = CachedFilmSimDB("/path/to/filmsim.db")
 """
 
 from __future__ import annotations
 
 import os
 import sqlite3
+import threading
 from dataclasses import dataclass
 from datetime import datetime, timezone, date, timedelta
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 
 
 def utc_now() -> datetime:
@@ -36,18 +44,59 @@ class PremiumInfo:
     premium_until: Optional[datetime]
 
 
+@dataclass
+class Reservation:
+    telegram_id: int
+    day: str            # the UTC day the slot was taken from; commit/release against it
+    allowed: bool
+    used: int           # exports counted today, including other reserved slots
+    limit: int
+    is_premium: bool
+    count: int = 1      # slots taken: fewer than asked for if the free limit ran out
+
+
 class FilmSimDB:
+    SQL_USAGE = "SELECT count FROM usage WHERE telegram_id=? AND day=?"
+    SQL_PREMIUM = "SELECT premium_until FROM users WHERE telegram_id=?"
+    SQL_CAN_PROCESS = """
+        SELECT COALESCE(u.count, 0), p.premium_until
+        FROM (SELECT ? AS telegram_id) q
+        LEFT JOIN usage u ON u.telegram_id = q.telegram_id AND u.day = ?
+        LEFT JOIN users p ON p.telegram_id = q.telegram_id
+    """
+    SQL_RESERVE_READ = """
+        SELECT COALESCE(u.count, 0), COALESCE(u.reserved, 0), p.premium_until
+        FROM (SELECT ? AS telegram_id) q
+        LEFT JOIN usage u ON u.telegram_id = q.telegram_id AND u.day = ?
+        LEFT JOIN users p ON p.telegram_id = q.telegram_id
+    """
+
     def __init__(self, db_path: str):
         self.db_path = os.path.abspath(db_path)
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._local = threading.local()
         self._init_db()
 
     def _connect(self) -> sqlite3.Connection:
-        con = sqlite3.connect(self.db_path)
-        con.execute("PRAGMA journal_mode=WAL;")
-        con.execute("PRAGMA synchronous=NORMAL;")
+        """
+        This thread's connection. Use as `with self._connect() as con:` —
+        the block is a transaction (commit/rollback), the connection stays open.
+        """
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.db_path, cached_statements=64)
+            con.execute("PRAGMA journal_mode=WAL;")
+            con.execute("PRAGMA synchronous=NORMAL;")
+            self._local.con = con
         return con
 
+    def close(self) -> None:
+        """Close this thread's connection (others close when their threads exit)."""
+        con = getattr(self._local, "con", None)
+        if con is not None:
+            con.close()
+            self._local.con = None
+
     def _init_db(self) -> None:
         with self._connect() as con:
             con.execute(
@@ -64,26 +113,28 @@ class FilmSimDB:
                     telegram_id INTEGER NOT NULL,
                     day         TEXT    NOT NULL,  -- YYYY-MM-DD
                     count       INTEGER NOT NULL DEFAULT 0,
+                    reserved    INTEGER NOT NULL DEFAULT 0,  -- exports queued, not yet committed
                     PRIMARY KEY (telegram_id, day)
                 )
                 """
             )
+            cols = {row[1] for row in con.execute("PRAGMA table_info(usage)")}
+            if "reserved" not in cols:
+                con.execute("ALTER TABLE usage ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0")
             con.commit()
 
     # ---------- premium ----------
 
     def get_premium_info(self, telegram_id: int) -> PremiumInfo:
         with self._connect() as con:
-            cur = con.execute(
-                "SELECT premium_until FROM users WHERE telegram_id=?",
-                (telegram_id,),
-            )
-            row = cur.fetchone()
+            row = con.execute(self.SQL_PREMIUM, (telegram_id,)).fetchone()
+        return self._premium_info(row[0] if row else None)
 
-        if not row or row[0] is None:
+    @staticmethod
+    def _premium_info(ts: Optional[int]) -> PremiumInfo:
+        if ts is None:
             return PremiumInfo(is_premium=False, premium_until=None)
-
-        premium_until = datetime.fromtimestamp(int(row[0]), tz=timezone.utc)
+        premium_until = datetime.fromtimestamp(int(ts), tz=timezone.utc)
         return PremiumInfo(is_premium=(premium_until > utc_now()), premium_until=premium_until)
 
     def is_premium(self, telegram_id: int) -> bool:
@@ -119,11 +170,7 @@ class FilmSimDB:
     def get_usage(self, telegram_id: int, day: Optional[str] = None) -> int:
         day = day or today_utc_iso()
         with self._connect() as con:
-            cur = con.execute(
-                "SELECT count FROM usage WHERE telegram_id=? AND day=?",
-                (telegram_id, day),
-            )
-            row = cur.fetchone()
+            row = con.execute(self.SQL_USAGE, (telegram_id, day)).fetchone()
         return int(row[0]) if row else 0
 
     def get_usage_today(self, telegram_id: int) -> int:
@@ -145,21 +192,222 @@ class FilmSimDB:
                 """,
                 (telegram_id, day, amount),
             )
-            con.commit()
-
-            cur = con.execute(
-                "SELECT count FROM usage WHERE telegram_id=? AND day=?",
-                (telegram_id, day),
-            )
-            row = cur.fetchone()
+            row = con.execute(self.SQL_USAGE, (telegram_id, day)).fetchone()
         return int(row[0]) if row else 0
 
     def can_process(self, telegram_id: int, free_daily_limit: int) -> Tuple[bool, int, int]:
         """
         Returns: (allowed, used_today, limit)
         Premium => allowed always, limit reported as free_daily_limit for UI consistency.
+        One query: today's usage joined with premium_until.
+        """
+        with self._connect() as con:
+            used, premium_until = con.execute(
+                self.SQL_CAN_PROCESS, (telegram_id, today_utc_iso())
+            ).fetchone()
+        used = int(used)
+        if self._premium_info(premium_until).is_premium:
+            return True, used, free_daily_limit
+        return (used < free_daily_limit), used, free_daily_limit
+
+
+    # ---------- reserve / commit / release ----------
+
+    def reserve_export(self, telegram_id: int, free_daily_limit: int, count: int = 1) -> Reservation:
+        """
+        Atomically check the quota and take `count` slots, one per exported
+        photo (one transaction). Free users get only what is left of today's
+        limit, so `Reservation.count` may be smaller; not allowed when none
+        is left. Follow with commit_export() on success or release_export()
+        on failure, passing the reserved count.
         """
+        day = today_utc_iso()
+        with self._connect() as con:
+            con.execute("BEGIN IMMEDIATE")
+            used, reserved, premium_until = con.execute(
+                self.SQL_RESERVE_READ, (telegram_id, day)
+            ).fetchone()
+            premium = self._premium_info(premium_until).is_premium
+            taken = int(used) + int(reserved)
+            granted = count if premium else max(0, min(count, free_daily_limit - taken))
+            if granted:
+                con.execute(
+                    """
+                    INSERT INTO usage (telegram_id, day, count, reserved)
+                    VALUES (?, ?, 0, ?)
+                    ON CONFLICT(telegram_id, day)
+                    DO UPDATE SET reserved = reserved + excluded.reserved
+                    """,
+                    (telegram_id, day, granted),
+                )
+        return Reservation(telegram_id, day, granted > 0, taken, free_daily_limit, premium, granted)
+
+    def commit_export(self, telegram_id: int, day: Optional[str] = None, count: int = 1) -> None:
+        """Turn `count` reserved slots into counted exports."""
+        with self._connect() as con:
+            con.execute(
+                """
+                INSERT INTO usage (telegram_id, day, count, reserved)
+                VALUES (?, ?, ?, 0)
+                ON CONFLICT(telegram_id, day)
+                DO UPDATE SET count = count + excluded.count, reserved = MAX(reserved - excluded.count, 0)
+                """,
+                (telegram_id, day or today_utc_iso(), count),
+            )
+
+    def release_export(self, telegram_id: int, day: Optional[str] = None, count: int = 1) -> None:
+        """Give back `count` reserved slots (render failed or job never queued)."""
+        with self._connect() as con:
+            con.execute(
+                "UPDATE usage SET reserved = MAX(reserved - ?, 0) WHERE telegram_id=? AND day=?",
+                (count, telegram_id, day or today_utc_iso()),
+            )
+
+class CachedFilmSimDB(FilmSimDB):
+    """
+    FilmSimDB with premium_until and today's usage counters held in memory.
+
+    - reads (is_premium, get_usage_today, can_process) never touch disk after
+      the first lookup per user/day
+    - premium entries are invalidated by set_premium_until / grant_premium_days
+    - increment_usage updates memory and queues a delta; deltas are written in
+      one batched transaction every `flush_interval` seconds and on close()
+    - export reservations are held in memory only (the bot is one process)
+
+    A crash can lose at most `flush_interval` seconds of usage increments.
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 5.0):
+        super().__init__(db_path)
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._premium: Dict[int, Optional[int]] = {}         # telegram_id -> premium_until ts
+        self._usage: Dict[Tuple[int, str], int] = {}         # (telegram_id, day) -> count
+        self._deltas: Dict[Tuple[int, str], int] = {}        # not yet written
+        self._reserved: Dict[Tuple[int, str], int] = {}      # slots held by queued exports
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    # ---------- premium ----------
+
+    def get_premium_info(self, telegram_id: int) -> PremiumInfo:
+        with self._lock:
+            if telegram_id in self._premium:
+                return self._premium_info(self._premium[telegram_id])
+        info = super().get_premium_info(telegram_id)
+        ts = int(info.premium_until.timestamp()) if info.premium_until else None
+        with self._lock:
+            self._premium.setdefault(telegram_id, ts)
+        return info
+
+    def set_premium_until(self, telegram_id: int, premium_until: Optional[datetime]) -> None:
+        super().set_premium_until(telegram_id, premium_until)
+        with self._lock:
+            self._premium.pop(telegram_id, None)
+
+    # ---------- usage ----------
+
+    def _cached_usage(self, telegram_id: int, day: str) -> int:
+        key = (telegram_id, day)
+        with self._lock:
+            if key in self._usage:
+                return self._usage[key]
+        stored = super().get_usage(telegram_id, day)
+        with self._lock:
+            # pending deltas for this key can only exist if it was cached, so none here
+            return self._usage.setdefault(key, stored)
+
+    def get_usage(self, telegram_id: int, day: Optional[str] = None) -> int:
+        return self._cached_usage(telegram_id, day or today_utc_iso())
+
+    def increment_usage(self, telegram_id: int, day: Optional[str] = None, amount: int = 1) -> int:
+        day = day or today_utc_iso()
+        self._cached_usage(telegram_id, day)
+        key = (telegram_id, day)
+        with self._lock:
+            self._usage[key] += amount
+            self._deltas[key] = self._deltas.get(key, 0) + amount
+            return self._usage[key]
+
+    def can_process(self, telegram_id: int, free_daily_limit: int) -> Tuple[bool, int, int]:
         used = self.get_usage_today(telegram_id)
         if self.is_premium(telegram_id):
             return True, used, free_daily_limit
         return (used < free_daily_limit), used, free_daily_limit
+
+    # ---------- reserve / commit / release ----------
+
+    def reserve_export(self, telegram_id: int, free_daily_limit: int, count: int = 1) -> Reservation:
+        """In-memory check-and-reserve under one lock; exact with any number of workers."""
+        day = today_utc_iso()
+        self._cached_usage(telegram_id, day)
+        premium = self.is_premium(telegram_id)
+        key = (telegram_id, day)
+        with self._lock:
+            taken = self._usage[key] + self._reserved.get(key, 0)
+            granted = count if premium else max(0, min(count, free_daily_limit - taken))
+            if granted:
+                self._reserved[key] = self._reserved.get(key, 0) + granted
+        return Reservation(telegram_id, day, granted > 0, taken, free_daily_limit, premium, granted)
+
+    def commit_export(self, telegram_id: int, day: Optional[str] = None, count: int = 1) -> None:
+        day = day or today_utc_iso()
+        with self._lock:
+            self._unreserve((telegram_id, day), count)
+            self.increment_usage(telegram_id, day, count)
+
+    def release_export(self, telegram_id: int, day: Optional[str] = None, count: int = 1) -> None:
+        with self._lock:
+            self._unreserve((telegram_id, day or today_utc_iso()), count)
+
+    def _unreserve(self, key: Tuple[int, str], count: int = 1) -> None:
+        # jobs recovered after a restart have no in-memory reservation; that's fine
+        n = self._reserved.get(key, 0)
+        if n > count:
+            self._reserved[key] = n - count
+        else:
+            self._reserved.pop(key, None)
+
+    # ---------- write-behind ----------
+
+    def flush(self) -> int:
+        """Write pending usage deltas in one transaction. Returns rows written."""
+        with self._lock:
+            batch, self._deltas = self._deltas, {}
+            # forget finished days once their deltas are on their way to disk
+            today = today_utc_iso()
+            for key in [k for k in self._usage if k[1] < today and k not in self._reserved]:
+                del self._usage[key]
+        if not batch:
+            return 0
+        rows = [(tid, day, amount) for (tid, day), amount in batch.items()]
+        try:
+            with self._connect() as con:
+                con.executemany(
+                    """
+                    INSERT INTO usage (telegram_id, day, count)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(telegram_id, day)
+                    DO UPDATE SET count = count + excluded.count
+                    """,
+                    rows,
+                )
+        except sqlite3.Error:
+            with self._lock:  # put them back for the next attempt
+                for key, amount in batch.items():
+                    self._deltas[key] = self._deltas.get(key, 0) + amount
+            raise
+        return len(rows)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"usage flush failed: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush()
+        super().close()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+ingest.py — streaming, content-addressed storage of uploaded inputs for FilmSimBot
+
+- downloads are streamed to disk in chunks while hashing (no 50MB bytes in RAM)
+- each distinct image is stored once under store/<hh>/<hash><ext>
+- a user's in.jpg / in.png is a hard link to the stored blob
+- Telegram's file_unique_id is remembered, so an identical resend skips the
+  download entirely
+- blobs no user links to any more (st_nlink == 1) are pruned
+
+Usage:
+    from ingest import InputStore, telegram_file_chunks
+    store = InputStore("/path/to/work/store")
+    in_path = "/path/to/work/123/in.jpg"
+    if not store.link_known(unique_id, in_path):
+        store.ingest(telegram_file_chunks(token, info.file_path), ".jpg", in_path, unique_id)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+import requests
+from telebot import apihelper
+
+CHUNK_SIZE = 256 * 1024
+TELEGRAM_FILE_URL = "https://api.telegram.org/file/bot{0}/{1}"
+
+
+def telegram_file_chunks(token: str, file_path: str, chunk_size: int = CHUNK_SIZE,
+                         timeout: float = 60) -> Iterable[bytes]:
+    """
+    Yield a Telegram file's bytes in chunks (what bot.download_file does,
+    without buffering it all). Honours apihelper.FILE_URL (local Bot API
+    server) and apihelper.proxy, as download_file does.
+    """
+    url = (apihelper.FILE_URL or TELEGRAM_FILE_URL).format(token, file_path)
+    with requests.get(url, stream=True, timeout=timeout, proxies=apihelper.proxy) as r:
+        r.raise_for_status()
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+
+
+def content_hash():
+    # blake2b is faster than sha256 on ARM cores without SHA extensions
+    return hashlib.blake2b(digest_size=16)
+
+
+class InputStore:
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._by_unique: Dict[str, str] = {}   # file_unique_id -> blob path
+        self._lock = threading.Lock()
+        self.dedup_hits = 0
+
+    def blob_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, digest[:2], digest + ext)
+
+    def link_known(self, file_unique_id: Optional[str], dest: str) -> Optional[str]:
+        """
+        Link dest to the blob for a file_unique_id we've already stored.
+        Returns its digest, or None if unknown.
+        """
+        if not file_unique_id:
+            return None
+        with self._lock:
+            blob = self._by_unique.get(file_unique_id)
+            if not blob or not os.path.isfile(blob):
+                return None
+            self._link(blob, dest)
+            self.dedup_hits += 1
+        return os.path.splitext(os.path.basename(blob))[0]
+
+    def ingest(self, chunks: Iterable[bytes], ext: str, dest: str,
+               file_unique_id: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Stream chunks to a temp file while hashing, move it into the store
+        (or drop it if that content is already stored) and link dest to it.
+        Returns (digest, was_new).
+        """
+        h = content_hash()
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    h.update(chunk)
+                    f.write(chunk)
+            digest = h.hexdigest()
+            blob = self.blob_path(digest, ext)
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            with self._lock:
+                was_new = not os.path.exists(blob)
+                if was_new:
+                    os.replace(tmp, blob)
+                else:
+                    self.dedup_hits += 1
+                if file_unique_id:
+                    self._by_unique[file_unique_id] = blob
+                self._link(blob, dest)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return digest, was_new
+
+    @staticmethod
+    def _link(blob: str, dest: str) -> None:
+        """Point dest at the blob (hard link; copy if the filesystem can't)."""
+        tmp = dest + ".link"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            shutil.copyfile(blob, tmp)
+        os.replace(tmp, dest)
+
+    def prune_orphans(self) -> int:
+        """Remove blobs nothing links to any more. Returns bytes reclaimed."""
+        freed = 0
+        with self._lock:
+            for d, _, files in os.walk(self.root):
+                for fn in files:
+                    if fn.endswith(".part"):
+                        continue  # download in progress
+                    p = os.path.join(d, fn)
+                    try:
+                        st = os.stat(p)
+                        if st.st_nlink <= 1:
+                            os.remove(p)
+                            freed += st.st_size
+                    except OSError:
+                        pass
+            live = {k: v for k, v in self._by_unique.items() if os.path.exists(v)}
+            self._by_unique = live
+        return freed
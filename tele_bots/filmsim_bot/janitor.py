@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+janitor.py — disk budget for FilmSimBot's per-user work directories
+
+work/<uid>/ holds a user's last input (a hard link into the input store,
+see ingest.py) and transient outputs. Nothing removed those directories,
+so with FILMSIM_DELETE_INPUT=0 every input stayed on disk forever. Each
+run of the janitor:
+
+- evicts user directories idle for more than `max_age` seconds
+- then, while the user directories + input store exceed `max_bytes`,
+  evicts the least recently used ones (directory mtime: it changes on
+  every upload and every export)
+- never touches a directory holding a path from `protected()` (inputs of
+  queued/running jobs, users with work in flight), nor one used in the
+  last `min_idle` seconds (an upload may be landing in it)
+- prunes store blobs no user links to any more, so the bytes come back
+
+Export cache files (work/exports) have their own budget and are left alone.
+
+Usage:
+    from janitor import Janitor
+    jan = Janitor(WORK_DIR, INPUT_STORE, max_bytes=2 << 30, max_age=86400, protected=lambda: set())
+    result = jan.run()   # {"reclaimed": bytes, "evicted": dirs, "used": bytes, ...}
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import time
+from typing import Callable, Iterable, List, Set, Tuple
+
+
+def _disk_usage(paths: Iterable[str]) -> int:
+    """Bytes of the files under `paths`, each hard-linked file counted once."""
+    out = {}
+    for top in paths:
+        for d, _, files in os.walk(top):
+            for fn in files:
+                try:
+                    st = os.stat(os.path.join(d, fn))
+                except OSError:
+                    continue
+                out[(st.st_dev, st.st_ino)] = st.st_size
+    return sum(out.values())
+
+
+class Janitor:
+    def __init__(self, work_dir: str, store, max_bytes: int, max_age: float,
+                 protected: Callable[[], Set[str]] = set, min_idle: float = 600):
+        self.work_dir = os.path.abspath(work_dir)
+        self.store = store
+        self.max_bytes = int(max_bytes)
+        self.max_age = max_age
+        self.protected = protected
+        self.min_idle = min_idle
+
+    def user_dirs(self) -> List[Tuple[float, str]]:
+        """(last used, path) of every work/<uid> directory, least recently used first."""
+        out = []
+        with os.scandir(self.work_dir) as it:
+            for e in it:
+                if e.name.isdigit() and e.is_dir(follow_symlinks=False):
+                    try:
+                        out.append((e.stat(follow_symlinks=False).st_mtime, e.path))
+                    except OSError:
+                        pass
+        out.sort()
+        return out
+
+    def _is_protected(self, path: str) -> bool:
+        prefix = path + os.sep
+        return any(p == path or p.startswith(prefix) for p in self.protected())
+
+    def run(self) -> dict:
+        now = time.time()
+        dirs = self.user_dirs()
+        used = _disk_usage([p for _, p in dirs] + [self.store.root])
+
+        evicted, expired = 0, 0
+        freed = 0      # bytes that stop being referenced (now, or once the store is pruned)
+        unlinked = 0   # of those, files only the directory held (freed by the rmtree itself)
+        for mtime, path in dirs:
+            idle = now - mtime
+            too_old = idle > self.max_age
+            if not too_old and used - freed <= self.max_bytes:
+                break  # LRU order: everything after this is newer
+            if idle < self.min_idle or self._is_protected(path):
+                continue
+            # bytes this directory alone keeps alive: files whose only other link is the store's
+            gone, own = 0, 0
+            for d, _, files in os.walk(path):
+                for fn in files:
+                    try:
+                        st = os.stat(os.path.join(d, fn))
+                    except OSError:
+                        continue
+                    if st.st_nlink <= 2:
+                        gone += st.st_size
+                    if st.st_nlink == 1:
+                        own += st.st_size
+            try:
+                shutil.rmtree(path)
+            except OSError as e:
+                print(f"janitor: could not remove {path}: {e}")
+                continue
+            evicted += 1
+            expired += too_old
+            freed += gone
+            unlinked += own
+
+        # the store keeps the blobs we just unlinked (and any other orphans) until pruned
+        reclaimed = unlinked + self.store.prune_orphans()
+        return {
+            "reclaimed": reclaimed,
+            "evicted": evicted,
+            "expired": expired,
+            "used": used - reclaimed,
+            "budget": self.max_bytes,
+            "users": len(dirs) - evicted,
+        }
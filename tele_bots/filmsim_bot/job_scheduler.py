@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+job_scheduler.py — weighted-fair export scheduler for FilmSimBot
+
+Replaces the two polled queues (premium / free):
+- workers block on one condition variable; no timeout polling
+- tiers are served by smooth weighted round-robin (default premium:free = 3:1)
+- within a tier, users are served round-robin so nobody hogs a tier
+- queue position + ETA per job (from a moving average of job durations)
+- optional JobStore: jobs are persisted on put and state changes are
+  recorded on get/task_done, so restore() can re-queue them after a restart
+
+Usage:
+    from job_scheduler import JobScheduler
+    sched = JobScheduler({"premium": 3, "free": 1}, maxsize=200)
+    job_id = sched.put({"user_id": 1, ...}, tier="free")
+    job = sched.get()            # blocks
+    sched.task_done(job, 4.2)    # seconds it took
+"""
+
+from __future__ import annotations
+
+import itertools
+import queue
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+
+class JobScheduler:
+    def __init__(self, weights: Dict[str, int], maxsize: int = 200, workers: int = 1,
+                 initial_job_seconds: float = 10.0, store=None):
+        if not weights:
+            raise ValueError("at least one tier is required")
+        self.weights = {t: max(1, int(w)) for t, w in weights.items()}
+        self.maxsize = maxsize
+        self.workers = max(1, workers)
+        self._cond = threading.Condition()
+        # tier -> user_id -> deque of jobs (user order = round-robin order)
+        self._tiers: Dict[str, "OrderedDict[int, deque]"] = {t: OrderedDict() for t in self.weights}
+        self._sizes: Dict[str, int] = {t: 0 for t in self.weights}
+        self._credit: Dict[str, int] = {t: 0 for t in self.weights}
+        self._ids = itertools.count(1)
+        self._avg = float(initial_job_seconds)
+        self.running = 0
+        self.store = store
+
+    # ---------- producer ----------
+
+    def put(self, job: dict, tier: str) -> int:
+        """Enqueue a job. Returns its job_id. Raises queue.Full if the tier is full."""
+        with self._cond:
+            if self._sizes[tier] >= self.maxsize:
+                raise queue.Full
+        # disk write outside the lock; workers keep pulling meanwhile
+        job_id = self.store.add(job, tier) if self.store is not None else next(self._ids)
+        job["job_id"] = job_id
+        job["tier"] = tier
+        with self._cond:
+            self._append(job)
+            self._cond.notify()
+        return job_id
+
+    def restore(self, jobs: List[dict]) -> int:
+        """Re-queue jobs recovered from the store (already persisted). Returns count."""
+        with self._cond:
+            for job in jobs:
+                if job.get("tier") in self._tiers:
+                    self._append(job)
+            self._cond.notify_all()
+            return sum(self._sizes.values())
+
+    # ---------- consumer ----------
+
+    def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Block until a job is available (or timeout → None)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: any(self._sizes.values()), timeout):
+                return None
+            tier = self._pick_tier(self._credit, self._sizes)
+            job = self._pop(self._tiers[tier])
+            self._sizes[tier] -= 1
+            self.running += 1
+        if self.store is not None:
+            self.store.mark_running(job["job_id"])
+        return job
+
+    def task_done(self, job: dict, seconds: Optional[float] = None) -> None:
+        with self._cond:
+            self.running = max(0, self.running - 1)
+            if seconds is not None and seconds > 0:
+                self._avg = 0.8 * self._avg + 0.2 * seconds
+        if self.store is not None:
+            self.store.mark_done(job["job_id"])
+
+    # ---------- introspection ----------
+
+    def qsize(self) -> int:
+        with self._cond:
+            return sum(self._sizes.values())
+
+    def position(self, job_id: int) -> Tuple[int, float]:
+        """
+        (1-based position in the service order, ETA seconds) for a queued job,
+        or (0, 0.0) if it isn't queued any more.
+        """
+        with self._cond:
+            order = self._simulate()
+            avg = self._avg
+        for i, jid in enumerate(order):
+            if jid == job_id:
+                # everything ahead of us, plus us, spread over the workers
+                return i + 1, avg * (i + 1) / self.workers
+        return 0, 0.0
+
+    # ---------- internals ----------
+
+    def _append(self, job: dict) -> None:
+        """Caller holds the lock."""
+        self._tiers[job["tier"]].setdefault(job["user_id"], deque()).append(job)
+        self._sizes[job["tier"]] += 1
+
+    def _pick_tier(self, credit: Dict[str, int], sizes: Dict[str, int]) -> str:
+        """Smooth weighted round-robin over non-empty tiers."""
+        live = [t for t in self.weights if sizes[t]]
+        total = sum(self.weights[t] for t in live)
+        for t in live:
+            credit[t] += self.weights[t]
+        best = max(live, key=lambda t: credit[t])
+        credit[best] -= total
+        return best
+
+    @staticmethod
+    def _pop(users: "OrderedDict[int, deque]") -> dict:
+        uid, jobs = next(iter(users.items()))
+        job = jobs.popleft()
+        if jobs:
+            users.move_to_end(uid)
+        else:
+            del users[uid]
+        return job
+
+    def _simulate(self) -> List[int]:
+        """Job ids in the order get() would hand them out. Caller holds the lock."""
+        tiers = {t: OrderedDict((u, deque(j)) for u, j in users.items()) for t, users in self._tiers.items()}
+        sizes = dict(self._sizes)
+        credit = dict(self._credit)
+        order = []
+        while any(sizes.values()):
+            tier = self._pick_tier(credit, sizes)
+            order.append(self._pop(tiers[tier])["job_id"])
+            sizes[tier] -= 1
+        return order
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+job_store.py — crash-safe persistence for FilmSimBot export jobs
+
+Jobs live in a `jobs` table (in filmsim.db) and move through
+queued → running → done. The JobScheduler stays the in-memory source of
+truth for ordering; this table is what survives a restart.
+
+Write cost on SD cards:
+- enqueue is written immediately (that's the one we must not lose)
+- queued→running and running→done transitions are buffered and committed
+  in batches; after a crash, anything not marked done is simply re-queued
+
+Usage:
+    from job_store import JobStore
+    store = JobStore("/path/to/filmsim.db")
+    for job in store.recover():
+        ...
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+
+
+class JobStore:
+    def __init__(self, db_path: str, flush_interval: float = 1.0, flush_batch: int = 32,
+                 keep_done_days: int = 7):
+        self.db_path = os.path.abspath(db_path)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._pending: List[tuple] = []          # (state, ts, job_id)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._local = threading.local()
+        self._init_db(keep_done_days)
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.db_path)
+            con.execute("PRAGMA journal_mode=WAL;")
+            con.execute("PRAGMA synchronous=NORMAL;")
+            self._local.con = con
+        return con
+
+    def _init_db(self, keep_done_days: int) -> None:
+        with self._connect() as con:
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                    telegram_id INTEGER NOT NULL,
+                    tier        TEXT    NOT NULL,
+                    state       TEXT    NOT NULL,   -- queued | running | done
+                    payload     TEXT    NOT NULL,   -- job dict as JSON
+                    created_at  REAL    NOT NULL,
+                    updated_at  REAL    NOT NULL
+                )
+                """
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, id)")
+            con.execute(
+                "DELETE FROM jobs WHERE state=? AND updated_at < ?",
+                (STATE_DONE, time.time() - keep_done_days * 86400),
+            )
+            con.commit()
+
+    # ---------- writes ----------
+
+    def add(self, job: dict, tier: str) -> int:
+        """Persist a new queued job (synchronously). Returns its id."""
+        now = time.time()
+        with self._connect() as con:
+            cur = con.execute(
+                """
+                INSERT INTO jobs (telegram_id, tier, state, payload, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (job["user_id"], tier, STATE_QUEUED, json.dumps(job), now, now),
+            )
+            con.commit()
+            return int(cur.lastrowid)
+
+    def mark_running(self, job_id: int) -> None:
+        self._queue_state(job_id, STATE_RUNNING)
+
+    def mark_done(self, job_id: int) -> None:
+        self._queue_state(job_id, STATE_DONE)
+
+    def _queue_state(self, job_id: int, state: str) -> None:
+        with self._lock:
+            self._pending.append((state, time.time(), job_id))
+            if len(self._pending) >= self.flush_batch:
+                self._wake.set()
+
+    def flush(self) -> int:
+        """Commit buffered state transitions in one transaction. Returns rows written."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        with self._connect() as con:
+            con.executemany("UPDATE jobs SET state=?, updated_at=? WHERE id=?", batch)
+            con.commit()
+        return len(batch)
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"job store flush failed: {e}")
+
+    # ---------- recovery ----------
+
+    def recover(self) -> List[dict]:
+        """
+        Jobs that were queued or running when the bot stopped, oldest first,
+        reset to queued. Each dict has job_id and tier filled in.
+        """
+        with self._connect() as con:
+            con.execute(
+                "UPDATE jobs SET state=?, updated_at=? WHERE state=?",
+                (STATE_QUEUED, time.time(), STATE_RUNNING),
+            )
+            rows = con.execute(
+                "SELECT id, tier, payload FROM jobs WHERE state=? ORDER BY id",
+                (STATE_QUEUED,),
+            ).fetchall()
+            con.commit()
+
+        out = []
+        for job_id, tier, payload in rows:
+            try:
+                job = json.loads(payload)
+            except ValueError:
+                continue
+            job["job_id"] = job_id
+            job["tier"] = tier
+            out.append(job)
+        return out
+
+    def counts(self) -> dict:
+        with self._connect() as con:
+            rows = con.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+    def active_paths(self) -> set:
+        """Input paths of jobs not yet done (state updates lag, so this errs on the safe side)."""
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT payload FROM jobs WHERE state IN (?, ?)",
+                (STATE_QUEUED, STATE_RUNNING),
+            ).fetchall()
+        paths = set()
+        for payload, in rows:
+            try:
+                job = json.loads(payload)
+            except ValueError:
+                continue
+            paths.update(p for p, _ in job.get("album") or ())
+            if job.get("in_path"):
+                paths.add(job["in_path"])
+        return {os.path.abspath(p) for p in paths}
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+jpeg_encoder.py — size-targeted JPEG encoding for FilmSimBot
+
+Telegram only accepts photos up to 10MB; anything larger has to go out as a
+(much bigger) document. Instead of encoding at a fixed quality and finding
+out afterwards, this predicts the output size before the real encode:
+
+- a mosaic of small tiles sampled across the image is encoded in memory
+  for each candidate setting → bytes per pixel × image pixels
+- the best setting (quality, progressive, chroma subsampling) predicted to
+  fit the budget is used for the full encode
+- if the real file still overshoots, the prediction error is corrected for
+  and the image is re-encoded once
+
+Usage:
+    from jpeg_encoder import encode_jpeg
+    info = encode_jpeg(img, "out.jpg", max_bytes=10 * 1024 * 1024, quality=95)
+    # {"quality": 92, "progressive": True, "subsampling": "4:2:0", "bytes": ..., ...}
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import threading
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageFile
+
+# room left for what exiftool adds afterwards (copied EXIF incl. thumbnail, XMP)
+METADATA_HEADROOM = 96 * 1024
+
+SAMPLE_TILE = 128              # multiple of 16 → tiles line up with 4:2:0 MCUs
+SAMPLE_GRID = (4, 3)           # tiles across, down
+_HEADER_BYTES = 600            # JFIF header + tables in the sample encode
+
+_SUBSAMPLING_NAMES = {0: "4:4:4", 1: "4:2:2", 2: "4:2:0"}
+
+# (quality, progressive, subsampling), best first. Size-targeted encodes start
+# at full chroma (4:4:4): at the delivered 2560px most photos fit with room to
+# spare, and Telegram's own re-encode then starts from unhalved colour. Next
+# comes 4:2:0, which is about a third smaller. Progressive costs nothing visually
+# and saves a few percent, so it is tried before any quality drop.
+_FALLBACKS = [(92, True, 2), (90, True, 2), (88, True, 2), (85, True, 2), (82, True, 2),
+              (80, True, 2), (75, True, 2), (70, True, 2), (65, True, 2), (60, True, 2)]
+
+
+def _ladder(quality: int) -> List[Tuple[int, bool, int]]:
+    steps = [(quality, False, 0), (quality, True, 0), (quality, False, 2), (quality, True, 2)]
+    steps += [s for s in _FALLBACKS if s[0] < quality]
+    return steps
+
+
+def _sample(img: Image.Image) -> Image.Image:
+    """Mosaic of tiles spread evenly over the image (the whole image if it's small)."""
+    cols, rows = SAMPLE_GRID
+    w, h = img.size
+    if w <= cols * SAMPLE_TILE or h <= rows * SAMPLE_TILE:
+        return img
+    mosaic = Image.new(img.mode, (cols * SAMPLE_TILE, rows * SAMPLE_TILE))
+    for r in range(rows):
+        for c in range(cols):
+            x = (2 * c + 1) * w // (2 * cols) - SAMPLE_TILE // 2
+            y = (2 * r + 1) * h // (2 * rows) - SAMPLE_TILE // 2
+            tile = img.crop((x, y, x + SAMPLE_TILE, y + SAMPLE_TILE))
+            mosaic.paste(tile, (c * SAMPLE_TILE, r * SAMPLE_TILE))
+    return mosaic
+
+
+def _save_kwargs(setting: Tuple[int, bool, int], icc: Optional[bytes]) -> dict:
+    quality, progressive, subsampling = setting
+    kw = {"quality": quality, "subsampling": subsampling, "optimize": True}
+    if progressive:
+        kw["progressive"] = True
+    if icc:
+        kw["icc_profile"] = icc
+    return kw
+
+
+_maxblock_lock = threading.Lock()
+
+
+def _save(img: Image.Image, fp, setting: Tuple[int, bool, int], icc: Optional[bytes]) -> None:
+    kw = _save_kwargs(setting, icc)
+    try:
+        img.save(fp, "JPEG", **kw)
+    except OSError:
+        # optimized/progressive encodes are buffered whole, and Pillow sizes that
+        # buffer at 1-2 bytes/pixel; noise-like images at 4:4:4 need more
+        if isinstance(fp, io.BytesIO):
+            fp.seek(0)
+            fp.truncate()
+        with _maxblock_lock:
+            old = ImageFile.MAXBLOCK
+            ImageFile.MAXBLOCK = max(old, 4 * img.width * img.height)
+            try:
+                img.save(fp, "JPEG", **kw)
+            finally:
+                ImageFile.MAXBLOCK = old
+
+
+def predict_size(img: Image.Image, setting: Tuple[int, bool, int], sample: Optional[Image.Image] = None) -> int:
+    """Predicted encoded size in bytes (image data only) for one setting."""
+    sample = sample if sample is not None else _sample(img)
+    buf = io.BytesIO()
+    _save(sample, buf, setting, None)
+    bpp = max(0, buf.tell() - _HEADER_BYTES) / (sample.width * sample.height)
+    return int(bpp * img.width * img.height) + _HEADER_BYTES
+
+
+def _pick(ladder, predictions, budget: int, scale: float = 1.0) -> int:
+    """Index of the first setting predicted to fit (the last one if none do)."""
+    for i, p in enumerate(predictions):
+        if p * scale <= budget:
+            return i
+    return len(ladder) - 1
+
+
+def encode_jpeg(img: Image.Image, out_path: str, max_bytes: Optional[int] = None, quality: int = 95,
+                icc: Optional[bytes] = None) -> dict:
+    """
+    Encode `img` to `out_path`. Without `max_bytes` this is a plain encode at
+    `quality`. With it, quality/progressive/subsampling are chosen so the
+    file (plus METADATA_HEADROOM) stays under max_bytes, with at most one
+    re-encode. Returns the choices made and the sizes predicted/achieved.
+    """
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    if not max_bytes:
+        setting = (quality, False, 2)
+        _save(img, out_path, setting, icc)
+        return _info(setting, None, os.path.getsize(out_path), 1)
+
+    budget = max_bytes - METADATA_HEADROOM - len(icc or b"")
+    ladder = _ladder(quality)
+    sample = _sample(img)
+
+    # predictions are monotonic along the ladder: stop at the first fit
+    predictions = []
+    for setting in ladder:
+        predictions.append(predict_size(img, setting, sample))
+        if predictions[-1] <= budget:
+            break
+    i = len(predictions) - 1
+
+    _save(img, out_path, ladder[i], icc)
+    size = os.path.getsize(out_path)
+    if size <= budget + len(icc or b"") or i == len(ladder) - 1:
+        return _info(ladder[i], predictions[i], size, 1)
+
+    # the sample underestimated this image: scale every prediction by the
+    # observed error and re-encode once with the corrected pick
+    scale = size / max(1, predictions[i])
+    while len(predictions) < len(ladder) and predictions[-1] * scale > budget:
+        predictions.append(predict_size(img, ladder[len(predictions)], sample))
+    j = _pick(ladder, predictions, budget, scale)
+    _save(img, out_path, ladder[j], icc)
+    return _info(ladder[j], int(predictions[j] * scale), os.path.getsize(out_path), 2)
+
+
+def _info(setting: Tuple[int, bool, int], predicted: Optional[int], size: int, passes: int) -> dict:
+    quality, progressive, subsampling = setting
+    return {
+        "quality": quality,
+        "progressive": progressive,
+        "subsampling": _SUBSAMPLING_NAMES[subsampling],
+        "predicted": predicted,
+        "bytes": size,
+        "passes": passes,
+    }
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+keyboards.py — pre-rendered LUT browsing keyboards for FilmSimBot
+
+Every (category page) and (category, LUT page) keyboard is built once per
+LutIndex version and kept as the JSON string Telegram wants, so paging is
+a dict lookup; pyTelegramBotAPI passes a str reply_markup through as is.
+
+Callback data is compact and doesn't depend on per-user state:
+    catpage|<page>                       category list page
+    cat|<version>|<cat_no>               open a category (index into categories())
+    page|<version>|<cat_no>|<page>       LUT list page of a category
+    lut|<page>|<lut_id>                  pick a LUT (stable LutIndex id)
+    cats|<page>                          back to the category list
+    sheet|<version>|<cat_no>|<page>      contact sheet of a LUT page
+Category numbers are only meaningful for the catalog version they were
+rendered from; lookups with a stale version return None.
+
+Usage:
+    from keyboards import KeyboardCache
+    kbs = KeyboardCache(LUT_INDEX, page_size=12)
+    bot.send_message(chat_id, "Pick a category:", reply_markup=kbs.categories(0))
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from telebot import types
+
+
+def _label(text: str, limit: int = 44) -> str:
+    return text if len(text) <= limit else ("…" + text[-(limit - 1):])
+
+
+def _display(rel: str) -> str:
+    return rel[:-5] if rel.lower().endswith(".cube") else rel  # extension looks nasty in menus
+
+
+class _Built:
+    __slots__ = ("version", "cats", "luts", "lut_pages", "names")
+
+    def __init__(self, version, cats, luts, lut_pages, names):
+        self.version = version
+        self.cats: Dict[int, str] = cats                 # page -> markup JSON
+        self.luts: Dict[Tuple[int, int], str] = luts     # (cat_no, page) -> markup JSON
+        self.lut_pages: List[int] = lut_pages            # cat_no -> page count
+        self.names: List[str] = names                    # cat_no -> category
+
+
+class KeyboardCache:
+    def __init__(self, index, page_size: int = 12, sheet_button: bool = False):
+        self.index = index
+        self.page_size = page_size
+        self.sheet_button = sheet_button
+        self._lock = threading.Lock()
+        self._built = _Built(None, {}, {}, [], [])
+
+    # ---------- lookups (one snapshot per call: a rebuild swaps it whole) ----------
+
+    @property
+    def version(self) -> int:
+        return self._sync().version
+
+    def categories(self, page: int) -> str:
+        b = self._sync()
+        return b.cats[self._clamp(page, len(b.cats))]
+
+    def luts(self, version: int, cat_no: int, page: int) -> Optional[str]:
+        """Markup for one LUT page, or None if the catalog changed since `version`."""
+        b = self._sync()
+        if version != b.version or not 0 <= cat_no < len(b.names):
+            return None
+        return b.luts[(cat_no, self._clamp(page, b.lut_pages[cat_no]))]
+
+    def category(self, version: int, cat_no: int) -> Optional[str]:
+        """Category name for a callback's number, or None if stale."""
+        b = self._sync()
+        if version != b.version or not 0 <= cat_no < len(b.names):
+            return None
+        return b.names[cat_no]
+
+    def category_no(self, name: str) -> Optional[int]:
+        try:
+            return self._sync().names.index(name)
+        except ValueError:
+            return None
+
+    # ---------- building ----------
+
+    def _sync(self) -> _Built:
+        """The current build, rebuilt first if the LUT catalog changed."""
+        version = self.index.version
+        if version != self._built.version:
+            with self._lock:
+                if version != self._built.version:
+                    self._built = self._build(version)
+        return self._built
+
+    def _build(self, version: int) -> _Built:
+        names = list(self.index.categories())
+        cats = {p: self._kb_categories(names, p, version).to_json() for p in range(self._pages(len(names)))}
+        luts, lut_pages = {}, []
+        for cat_no, name in enumerate(names):
+            rels = self.index.by_category(name)
+            lut_pages.append(self._pages(len(rels)))
+            for p in range(lut_pages[-1]):
+                luts[(cat_no, p)] = self._kb_luts(rels, cat_no, p, version).to_json()
+        return _Built(version, cats, luts, lut_pages, names)
+
+    def _pages(self, total: int) -> int:
+        return max(1, math.ceil(total / self.page_size))
+
+    def _clamp(self, page: int, pages: int) -> int:
+        return max(0, min(page, pages - 1))
+
+    def _nav(self, page: int, pages: int, prefix: str) -> list:
+        nav = []
+        if page > 0:
+            nav.append(types.InlineKeyboardButton("⬅ Prev", callback_data=f"{prefix}{page-1}"))
+        nav.append(types.InlineKeyboardButton(f"Page {page+1}/{pages}", callback_data="noop"))
+        if page < pages - 1:
+            nav.append(types.InlineKeyboardButton("Next ➡", callback_data=f"{prefix}{page+1}"))
+        return nav
+
+    def _kb_categories(self, names: list, page: int, version: int) -> types.InlineKeyboardMarkup:
+        kb = types.InlineKeyboardMarkup(row_width=1)
+        start = page * self.page_size
+        for cat_no in range(start, min(len(names), start + self.page_size)):
+            kb.add(types.InlineKeyboardButton(_label(names[cat_no]), callback_data=f"cat|{version}|{cat_no}"))
+        kb.row(*self._nav(page, self._pages(len(names)), "catpage|"))
+        return kb
+
+    def _kb_luts(self, rels: list, cat_no: int, page: int, version: int) -> types.InlineKeyboardMarkup:
+        kb = types.InlineKeyboardMarkup(row_width=1)
+        start = page * self.page_size
+        for rel in rels[start:start + self.page_size]:
+            kb.add(types.InlineKeyboardButton(_label(_display(rel)),
+                                              callback_data=f"lut|{page}|{self.index.id_of(rel)}"))
+        kb.row(*self._nav(page, self._pages(len(rels)), f"page|{version}|{cat_no}|"))
+        back = [types.InlineKeyboardButton("⬅ Categories", callback_data=f"cats|{cat_no // self.page_size}")]
+        if self.sheet_button:
+            back.append(types.InlineKeyboardButton("🗂 Contact sheet",
+                                                   callback_data=f"sheet|{version}|{cat_no}|{page}"))
+        kb.row(*back)
+        return kb
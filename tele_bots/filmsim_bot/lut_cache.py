@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+lut_cache.py — compiled LUT cache for FilmSimBot
+
+Two tiers:
+- disk: each .cube is compiled once into a float16 .npy (memory-mappable)
+  plus a small JSON header, keyed by LUT path and invalidated by mtime/size
+- memory: LRU of the hottest LUTs, bounded by a byte budget
+
+Usage:
+    from lut_cache import LutCache
+    cache = LutCache("/home/holly/luts/.lutcache", max_bytes=256 * 1024 * 1024)
+    lut = cache.get("/home/holly/luts/Kodak/Portra.cube")
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import numpy as np
+
+from lut_engine import CubeLut, load_cube
+
+CACHE_VERSION = 1
+
+
+class LutCache:
+    def __init__(self, cache_dir: Optional[str], max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+        self.max_bytes = int(max_bytes)
+        self._mem: "OrderedDict[str, tuple]" = OrderedDict()   # path -> (stamp, CubeLut)
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                print(f"LUT cache dir unavailable ({e}); memory tier only")
+                self.cache_dir = None
+
+    # ---------- public ----------
+
+    def get(self, lut_path: str) -> CubeLut:
+        lut_path = os.path.abspath(lut_path)
+        stamp = self._stamp(lut_path)
+
+        with self._lock:
+            hit = self._mem.get(lut_path)
+            if hit and hit[0] == stamp:
+                self._mem.move_to_end(lut_path)
+                self.hits += 1
+                return hit[1]
+        self.misses += 1
+
+        lut = self._load_compiled(lut_path, stamp)
+        if lut is None:
+            lut = load_cube(lut_path)
+            self._store_compiled(lut_path, stamp, lut)
+            # serve the same float16 values the disk tier would
+            lut.table = lut.table.astype(np.float16)
+
+        self._remember(lut_path, stamp, lut)
+        return lut
+
+    def warm(self, lut_paths: Iterable[str]) -> int:
+        """Compile every LUT to disk and fill the memory tier. Returns count loaded."""
+        n = 0
+        for p in lut_paths:
+            try:
+                self.get(p)
+                n += 1
+            except Exception as e:
+                print(f"LUT warm failed for {p}: {e}")
+        return n
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._mem),
+                "bytes": self._mem_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    # ---------- memory tier ----------
+
+    def _remember(self, lut_path: str, stamp: tuple, lut: CubeLut) -> None:
+        size = lut.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._mem.pop(lut_path, None)
+            if old:
+                self._mem_bytes -= old[1].nbytes
+            self._mem[lut_path] = (stamp, lut)
+            self._mem_bytes += size
+            while self._mem_bytes > self.max_bytes and self._mem:
+                _, (_, evicted) = self._mem.popitem(last=False)
+                self._mem_bytes -= evicted.nbytes
+
+    # ---------- disk tier ----------
+
+    @staticmethod
+    def _stamp(lut_path: str) -> tuple:
+        st = os.stat(lut_path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _paths(self, lut_path: str):
+        key = hashlib.sha1(lut_path.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + ".npy", base + ".json"
+
+    def _load_compiled(self, lut_path: str, stamp: tuple) -> Optional[CubeLut]:
+        if not self.cache_dir:
+            return None
+        npy, meta = self._paths(lut_path)
+        try:
+            with open(meta, "r", encoding="utf-8") as f:
+                h = json.load(f)
+            if h.get("version") != CACHE_VERSION or h.get("path") != lut_path:
+                return None
+            if (h.get("mtime_ns"), h.get("size")) != stamp:
+                return None
+            table = np.load(npy, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+        return CubeLut(
+            size=int(h["lut_size"]),
+            table=table,
+            domain_min=np.array(h["domain_min"], dtype=np.float32),
+            domain_max=np.array(h["domain_max"], dtype=np.float32),
+            title=h.get("title", ""),
+        )
+
+    def _store_compiled(self, lut_path: str, stamp: tuple, lut: CubeLut) -> None:
+        if not self.cache_dir:
+            return
+        npy, meta = self._paths(lut_path)
+        header = {
+            "version": CACHE_VERSION,
+            "path": lut_path,
+            "mtime_ns": stamp[0],
+            "size": stamp[1],
+            "lut_size": lut.size,
+            "domain_min": [float(v) for v in lut.domain_min],
+            "domain_max": [float(v) for v in lut.domain_max],
+            "title": lut.title,
+        }
+        try:
+            # write-then-rename so a reader never sees a half-written file
+            tmp_npy = npy + ".tmp.npy"
+            np.save(tmp_npy, lut.table.astype(np.float16))
+            os.replace(tmp_npy, npy)
+            tmp_meta = meta + ".tmp"
+            with open(tmp_meta, "w", encoding="utf-8") as f:
+                json.dump(header, f)
+            os.replace(tmp_meta, meta)
+        except OSError as e:
+            print(f"LUT cache write failed for {lut_path}: {e}")
@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+lut_engine.py — in-process .cube LUT renderer for FilmSimBot
+
+Does the same job as apply_lut.sh without forking gmic:
+- parse a 3D .cube LUT into a float32 NumPy table
+- map pixels through it (trilinear or tetrahedral interpolation)
+- blend with the original by intensity
+- dither Float → 8-bit and encode JPG, all in memory (16-bit grayscale inputs are scaled, not clipped)
+
+Usage:
+    from lut_engine import render_file
+    render_file("in.jpg", "/luts/Kodak/Portra.cube", "out.jpg", 0.75)
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from decode import decode, open_scaled, to_rgb8
+from jpeg_encoder import encode_jpeg
+
+INTERP_TRILINEAR = "trilinear"
+INTERP_TETRAHEDRAL = "tetrahedral"
+DEFAULT_INTERP = os.environ.get("FILMSIM_LUT_INTERP", INTERP_TRILINEAR)
+
+JPEG_QUALITY = int(os.environ.get("FILMSIM_JPEG_QUALITY", "95"))
+
+# The float pipeline needs well over 100 bytes of temporaries per pixel, so images are
+# graded in strips of about TILE_PIXELS, RENDER_THREADS at a time. NumPy drops
+# the GIL inside the heavy ops, so the threads run on separate cores.
+TILE_PIXELS = int(os.environ.get("FILMSIM_TILE_PIXELS", str(256 * 1024)))
+RENDER_THREADS = int(os.environ.get("FILMSIM_RENDER_THREADS", "0")) or os.cpu_count() or 1
+PREVIEW_MAX_SIDE = 768
+PREVIEW_QUALITY = 85
+SHEET_TILE = 256
+SHEET_COLS = 4
+
+HARD_TAG = "Made on telegram with @FilmSimBot"
+
+
+@dataclass
+class CubeLut:
+    size: int
+    table: np.ndarray          # (size, size, size, 3) float32, indexed [r, g, b]
+    domain_min: np.ndarray     # (3,) float32
+    domain_max: np.ndarray     # (3,) float32
+    title: str = ""
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.table.nbytes)
+
+
+# ---------- .cube parsing ----------
+
+def parse_cube(text: str) -> CubeLut:
+    size = None
+    title = ""
+    dmin = [0.0, 0.0, 0.0]
+    dmax = [1.0, 1.0, 1.0]
+    rows = []
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        head = line.split(None, 1)[0].upper()
+        if head == "TITLE":
+            title = line.split(None, 1)[1].strip().strip('"') if " " in line else ""
+        elif head == "LUT_3D_SIZE":
+            size = int(line.split()[1])
+        elif head == "LUT_1D_SIZE":
+            raise ValueError("1D .cube LUTs are not supported")
+        elif head == "DOMAIN_MIN":
+            dmin = [float(v) for v in line.split()[1:4]]
+        elif head == "DOMAIN_MAX":
+            dmax = [float(v) for v in line.split()[1:4]]
+        elif head[0].isalpha():
+            # unknown keyword (LUT_3D_INPUT_RANGE etc.) — ignore
+            continue
+        else:
+            rows.append(line)
+
+    if not size:
+        raise ValueError("LUT_3D_SIZE missing")
+    if len(rows) != size ** 3:
+        raise ValueError(f"expected {size ** 3} LUT entries, found {len(rows)}")
+
+    flat = np.array(" ".join(rows).split(), dtype=np.float32)
+    # .cube order: red varies fastest, so a plain reshape is [b, g, r]
+    table = flat.reshape(size, size, size, 3).transpose(2, 1, 0, 3)
+    return CubeLut(
+        size=size,
+        table=np.ascontiguousarray(table),
+        domain_min=np.array(dmin, dtype=np.float32),
+        domain_max=np.array(dmax, dtype=np.float32),
+        title=title,
+    )
+
+
+def load_cube(path: str) -> CubeLut:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return parse_cube(f.read())
+
+
+# ---------- interpolation ----------
+
+def _lattice(rgb: np.ndarray, lut: CubeLut):
+    n = lut.size
+    span = np.maximum(lut.domain_max - lut.domain_min, 1e-12)
+    x = (rgb - lut.domain_min) / span * (n - 1)
+    np.clip(x, 0, n - 1, out=x)
+    i0 = np.minimum(x.astype(np.int32), n - 2)
+    f = x - i0.astype(np.float32)
+    return i0, f
+
+
+def _trilinear(rgb: np.ndarray, lut: CubeLut) -> np.ndarray:
+    t = lut.table
+    i0, f = _lattice(rgb, lut)
+    r0, g0, b0 = i0[..., 0], i0[..., 1], i0[..., 2]
+    r1, g1, b1 = r0 + 1, g0 + 1, b0 + 1
+    fr, fg, fb = f[..., 0:1], f[..., 1:2], f[..., 2:3]
+
+    c00 = t[r0, g0, b0] * (1 - fr) + t[r1, g0, b0] * fr
+    c10 = t[r0, g1, b0] * (1 - fr) + t[r1, g1, b0] * fr
+    c01 = t[r0, g0, b1] * (1 - fr) + t[r1, g0, b1] * fr
+    c11 = t[r0, g1, b1] * (1 - fr) + t[r1, g1, b1] * fr
+    c0 = c00 * (1 - fg) + c10 * fg
+    c1 = c01 * (1 - fg) + c11 * fg
+    return c0 * (1 - fb) + c1 * fb
+
+
+def _tetrahedral(rgb: np.ndarray, lut: CubeLut) -> np.ndarray:
+    t = lut.table
+    i0, f = _lattice(rgb, lut)
+    r0, g0, b0 = i0[..., 0], i0[..., 1], i0[..., 2]
+    r1, g1, b1 = r0 + 1, g0 + 1, b0 + 1
+    fr, fg, fb = f[..., 0:1], f[..., 1:2], f[..., 2:3]
+
+    c000 = t[r0, g0, b0]
+    c111 = t[r1, g1, b1]
+    c100 = t[r1, g0, b0]
+    c010 = t[r0, g1, b0]
+    c001 = t[r0, g0, b1]
+    c110 = t[r1, g1, b0]
+    c101 = t[r1, g0, b1]
+    c011 = t[r0, g1, b1]
+
+    out = np.empty_like(c000)
+
+    # six tetrahedra of the unit cube, selected by the ordering of fr/fg/fb
+    cases = (
+        ((fr >= fg) & (fg >= fb), fr, fg, fb, c100, c110),
+        ((fr >= fb) & (fb > fg), fr, fb, fg, c100, c101),
+        ((fb > fr) & (fr >= fg), fb, fr, fg, c001, c101),
+        ((fg > fr) & (fr >= fb), fg, fr, fb, c010, c110),
+        ((fg >= fb) & (fb > fr), fg, fb, fr, c010, c011),
+        ((fb > fg) & (fg > fr), fb, fg, fr, c001, c011),
+    )
+    for mask, a, b, c, ca, cab in cases:
+        m = mask[..., 0]
+        a, b, c = a[m], b[m], c[m]
+        out[m] = (1 - a) * c000[m] + (a - b) * ca[m] + (b - c) * cab[m] + c * c111[m]
+    return out
+
+
+def apply_lut(rgb: np.ndarray, lut: CubeLut, interp: str = DEFAULT_INTERP) -> np.ndarray:
+    """Map float32 RGB in [0, 1], shape (..., 3), through the LUT."""
+    if interp == INTERP_TETRAHEDRAL:
+        return _tetrahedral(rgb, lut)
+    if interp == INTERP_TRILINEAR:
+        return _trilinear(rgb, lut)
+    raise ValueError(f"Unknown interpolation: {interp}")
+
+
+def _trilinear_corners(rgb: np.ndarray, lut: CubeLut):
+    """Flat table indices + weights of the 8 lattice corners, reusable across LUTs of one shape."""
+    n = lut.size
+    i0, f = _lattice(rgb, lut)
+    r0, g0, b0 = i0[..., 0], i0[..., 1], i0[..., 2]
+    fr, fg, fb = f[..., 0:1], f[..., 1:2], f[..., 2:3]
+    idx, w = [], []
+    for dr in (0, 1):
+        wr = fr if dr else 1 - fr
+        for dg in (0, 1):
+            wg = fg if dg else 1 - fg
+            for db in (0, 1):
+                wb = fb if db else 1 - fb
+                idx.append(((r0 + dr) * n + (g0 + dg)) * n + (b0 + db))
+                w.append(wr * wg * wb)
+    return idx, w
+
+
+def apply_luts_batch(rgb: np.ndarray, luts: list) -> list:
+    """
+    Trilinear-map one image through many LUTs. Lattice positions and corner
+    weights are computed once per (size, domain) and shared by every LUT.
+    """
+    corners = {}
+    out = []
+    for lut in luts:
+        key = (lut.size, tuple(lut.domain_min), tuple(lut.domain_max))
+        if key not in corners:
+            corners[key] = _trilinear_corners(rgb, lut)
+        idx, w = corners[key]
+        flat = lut.table.reshape(-1, 3)
+        acc = flat[idx[0]] * w[0]
+        for i, wi in zip(idx[1:], w[1:]):
+            acc += flat[i] * wi
+        out.append(acc)
+    return out
+
+
+# ---------- blend + quantise ----------
+
+def blend(src: np.ndarray, graded: np.ndarray, intensity: float) -> np.ndarray:
+    intensity = min(1.0, max(0.0, float(intensity)))
+    if intensity >= 1.0:
+        return graded
+    if intensity <= 0.0:
+        return src
+    # src*(1-k) + graded*k, in place on graded
+    graded -= src
+    graded *= intensity
+    graded += src
+    return graded
+
+
+def quantize_dithered(rgb: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Float [0, 1] → uint8 with ±0.5 LSB uniform dither so smooth gradients
+    don't band (the job of `gmic -noise` in apply_lut.sh). apply_lut.sh's
+    16-bit PNG is only a stop on the way to an 8-bit JPEG; here the float
+    result is dithered straight to 8 bits.
+    """
+    rng = rng or np.random.default_rng()
+    v = rgb * 255.0
+    v += rng.random(size=v.shape, dtype=np.float32)
+    v -= 0.5
+    np.clip(np.rint(v, out=v), 0, 255.0, out=v)
+    return v.astype(np.uint8)
+
+
+# ---------- file level ----------
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _forget_executor() -> None:
+    # a forked child gets the parent's executor object but none of its threads
+    # (nor a sane lock state): start over with a fresh one on first use
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_executor)
+
+
+def _tile_executor() -> ThreadPoolExecutor:
+    # created on first use, per process (see _forget_executor)
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RENDER_THREADS, thread_name_prefix="lut-tile")
+        return _executor
+
+
+def _render_rows(src: np.ndarray, out: np.ndarray, y0: int, y1: int, lut: CubeLut,
+                 intensity: float, interp: str) -> None:
+    rgb = src[y0:y1].astype(np.float32)
+    rgb *= 1.0 / 255.0
+    graded = apply_lut(rgb, lut, interp)
+    # one generator per strip: Generators aren't safe to share between threads
+    out[y0:y1] = quantize_dithered(blend(rgb, graded, intensity), rng=np.random.default_rng())
+
+
+def render(img: Image.Image, lut: CubeLut, intensity: float, interp: str = DEFAULT_INTERP) -> Image.Image:
+    """
+    Grade an image strip by strip. Only the 8-bit input and output are held
+    whole; float working memory is bounded by TILE_PIXELS × RENDER_THREADS,
+    also when several renders share the process.
+    """
+    src = np.asarray(to_rgb8(img))
+    out = np.empty_like(src)
+    h, w = src.shape[:2]
+    rows = max(1, TILE_PIXELS // max(1, w))
+    strips = [(y, min(h, y + rows)) for y in range(0, h, rows)]
+
+    if RENDER_THREADS <= 1 or len(strips) == 1:
+        for y0, y1 in strips:
+            _render_rows(src, out, y0, y1, lut, intensity, interp)
+    else:
+        ex = _tile_executor()
+        futures = [ex.submit(_render_rows, src, out, y0, y1, lut, intensity, interp) for y0, y1 in strips]
+        for f in futures:
+            f.result()
+    return Image.fromarray(out, "RGB")
+
+
+def metadata_args(in_path: str, out_path: str, lut_path: str, intensity: float) -> list:
+    """
+    One exiftool command that copies tags from the input and adds the LUT
+    note (the two exiftool runs in apply_lut.sh, batched). Assignments after
+    -TagsFromFile are applied on top of the copied tags.
+    """
+    lut_name = os.path.basename(lut_path)
+    note = f"Applied LUT: {lut_name}; Intensity={float(intensity):.6f}"
+    return [
+        "-overwrite_original", "-P",
+        "-TagsFromFile", in_path, "-all:all",
+        f"-EXIF:ImageDescription={note}",
+        f"-XMP:Description={note}",
+        f"-XMP:CreatorTool={HARD_TAG}",
+        f"-XMP:Subject+=LUT:{lut_name}", f"-XMP:Subject+={HARD_TAG}",
+        f"-IPTC:Keywords+=LUT:{lut_name}", f"-IPTC:Keywords+={HARD_TAG}",
+        out_path,
+    ]
+
+
+def render_preview(
+    in_path: str,
+    lut: CubeLut,
+    intensity: float,
+    max_side: int = PREVIEW_MAX_SIDE,
+    interp: str = DEFAULT_INTERP,
+) -> bytes:
+    """Small JPEG (bytes) of the look, for judging a recipe before exporting."""
+    with open_scaled(in_path, max_side) as img:
+        out = render(img, lut, intensity, interp)
+    buf = io.BytesIO()
+    out.save(buf, "JPEG", quality=PREVIEW_QUALITY)
+    return buf.getvalue()
+
+
+def render_contact_sheet(
+    in_path: str,
+    luts: list,
+    tile: int = SHEET_TILE,
+    cols: int = SHEET_COLS,
+) -> bytes:
+    """
+    Grid JPEG (bytes) of one photo through many LUTs. `luts` is a list of
+    (label, CubeLut). The photo is decoded and downscaled once.
+    """
+    with open_scaled(in_path, tile) as img:
+        src = np.asarray(img.convert("RGB"), dtype=np.float32)
+    src *= 1.0 / 255.0
+    h, w = src.shape[:2]
+
+    graded = apply_luts_batch(src, [lut for _, lut in luts])
+
+    label_h = 18
+    rows = max(1, -(-len(luts) // cols))
+    sheet = Image.new("RGB", (cols * w, rows * (h + label_h)), (16, 16, 16))
+    draw = ImageDraw.Draw(sheet)
+    font = ImageFont.load_default()
+    max_chars = max(4, w // 7)
+
+    for i, ((label, _), arr) in enumerate(zip(luts, graded)):
+        x, y = (i % cols) * w, (i // cols) * (h + label_h)
+        sheet.paste(Image.fromarray(quantize_dithered(arr), "RGB"), (x, y))
+        text = label if len(label) <= max_chars else ("..." + label[-(max_chars - 3):])
+        draw.text((x + 4, y + h + 3), text, fill=(230, 230, 230), font=font)
+
+    buf = io.BytesIO()
+    sheet.save(buf, "JPEG", quality=PREVIEW_QUALITY)
+    return buf.getvalue()
+
+
+def annotate_metadata(in_path: str, out_path: str, lut_path: str, intensity: float, exiftool=None) -> None:
+    """Copy + annotate metadata via a running ExifToolDaemon, or a one-off exiftool."""
+    args = metadata_args(in_path, out_path, lut_path, intensity)
+    if exiftool is not None:
+        exiftool.execute(*args)
+        return
+    if not shutil.which("exiftool"):
+        return
+    subprocess.run(["exiftool", *args], check=True, stdout=subprocess.DEVNULL)
+
+
+def render_file(
+    in_path: str,
+    lut_path: str,
+    out_path: str,
+    intensity: float = 1.0,
+    interp: str = DEFAULT_INTERP,
+    lut: Optional[CubeLut] = None,
+    exiftool=None,
+    timings: Optional[dict] = None,
+    max_side: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+) -> str:
+    """
+    Drop-in for `apply_lut.sh <in> <lut> <out> <intensity>`.
+    Pass an already loaded `lut` (e.g. from LutCache) to skip parsing, and an
+    ExifToolDaemon as `exiftool` to avoid starting Perl per export.
+    With `max_side`, the image is decoded at reduced size (see decode)
+    before the LUT is applied (only render the pixels that get delivered).
+    With `max_bytes`, JPEG settings are picked to land under that size
+    (see jpeg_encoder).
+    If `timings` is given, seconds per stage are stored in it
+    (decode, render, encode, metadata; plus lut_load if it parsed the LUT),
+    and the encoder's choices/sizes under "encoder".
+    Returns out_path.
+    """
+    t = {}
+    if lut is None:
+        t0 = time.perf_counter()
+        lut = load_cube(lut_path)
+        t["lut_load"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with decode(in_path, max_side) as img:
+        icc = img.info.get("icc_profile")
+        t["decode"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        out = render(img, lut, intensity, interp)
+        t["render"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    t["encoder"] = encode_jpeg(out, out_path, max_bytes=max_bytes, quality=JPEG_QUALITY, icc=icc)
+    t["encode"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    annotate_metadata(in_path, out_path, lut_path, intensity, exiftool=exiftool)
+    t["metadata"] = time.perf_counter() - t0
+
+    if timings is not None:
+        timings.update(t)
+    return out_path
+
+
+def render_files(
+    items: list,
+    lut_path: str,
+    intensity: float = 1.0,
+    interp: str = DEFAULT_INTERP,
+    lut: Optional[CubeLut] = None,
+    exiftool=None,
+    max_side: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+) -> list:
+    """
+    render_file for a batch: one LUT over several (in_path, out_path) pairs.
+    The LUT is loaded once, and the stages are pipelined across images:
+    while image i renders on the tile threads, image i+1 decodes and
+    image i-1 encodes (+ metadata) on two helper threads. Pillow's codecs
+    drop the GIL, so those overlap with the strips. At most three images
+    are in memory at once. With a single render thread there is no spare
+    core to overlap on, and the photos are done one after another.
+    Returns one timings dict per item (same stages as render_file), in order.
+    """
+    timings = [{} for _ in items]
+    if not items:
+        return timings
+    if lut is None:
+        t0 = time.perf_counter()
+        lut = load_cube(lut_path)
+        timings[0]["lut_load"] = time.perf_counter() - t0
+
+    def _decode(i: int):
+        t0 = time.perf_counter()
+        img = decode(items[i][0], max_side)
+        timings[i]["decode"] = time.perf_counter() - t0
+        return img
+
+    def _encode(i: int, out: Image.Image, icc) -> None:
+        in_path, out_path = items[i]
+        t0 = time.perf_counter()
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+        timings[i]["encoder"] = encode_jpeg(out, out_path, max_bytes=max_bytes, quality=JPEG_QUALITY, icc=icc)
+        timings[i]["encode"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        annotate_metadata(in_path, out_path, lut_path, intensity, exiftool=exiftool)
+        timings[i]["metadata"] = time.perf_counter() - t0
+
+    if RENDER_THREADS <= 1:
+        for i in range(len(items)):
+            with _decode(i) as img:
+                icc = img.info.get("icc_profile")
+                t0 = time.perf_counter()
+                out = render(img, lut, intensity, interp)
+                timings[i]["render"] = time.perf_counter() - t0
+            _encode(i, out, icc)
+        return timings
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="lut-batch") as ex:
+        decoding = ex.submit(_decode, 0)
+        encoding = None
+        for i in range(len(items)):
+            img = decoding.result()
+            if i + 1 < len(items):
+                decoding = ex.submit(_decode, i + 1)
+            with img:
+                icc = img.info.get("icc_profile")
+                t0 = time.perf_counter()
+                out = render(img, lut, intensity, interp)
+                timings[i]["render"] = time.perf_counter() - t0
+            if encoding is not None:
+                encoding.result()
+            encoding = ex.submit(_encode, i, out, icc)
+        encoding.result()
+    return timings
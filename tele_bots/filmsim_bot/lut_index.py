@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+lut_index.py — in-memory catalog of the LUT library for FilmSimBot
+
+Built once at startup; afterwards only directory mtimes are polled and
+changed directories re-listed, so menus never walk the filesystem.
+
+Provides:
+- sorted list of all LUTs (paths relative to LUT_DIR, "/" separated)
+- categories (first path component) and per-category sorted lists
+- stable integer IDs per LUT (optionally persisted to a JSON file)
+- a `version` counter that bumps whenever the catalog changes; persisted
+  with the IDs (plus a hash of the LUT list), so it survives restarts and
+  also bumps if the library changed while the bot was down
+
+Usage:
+    from lut_index import LutIndex
+    idx = LutIndex("/home/holly/luts")
+    idx.start_polling(30)
+    idx.by_category("Kodak")
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+CATEGORY_ALL = "All"
+CATEGORY_UNCATEGORIZED = "Uncategorized"
+
+
+class _Snapshot:
+    __slots__ = ("luts", "categories", "by_cat")
+
+    def __init__(self, luts: List[str]):
+        self.luts = luts
+        by_cat: Dict[str, List[str]] = {CATEGORY_ALL: luts}
+        for rel in luts:  # already sorted, so each bucket stays sorted
+            cat = rel.split("/", 1)[0] if "/" in rel else CATEGORY_UNCATEGORIZED
+            by_cat.setdefault(cat, []).append(rel)
+        self.by_cat = by_cat
+        self.categories = [CATEGORY_ALL] + sorted(c for c in by_cat if c != CATEGORY_ALL)
+
+
+class LutIndex:
+    def __init__(self, lut_dir: str, ids_path: Optional[str] = None):
+        self.lut_dir = os.path.abspath(lut_dir)
+        self.ids_path = ids_path
+        self.version = 0
+        self._lock = threading.Lock()
+        self._dirs: Dict[str, int] = {}            # abs dir -> mtime_ns
+        self._files: Dict[str, List[str]] = {}     # abs dir -> rel LUT paths in it
+        self._children: Dict[str, List[str]] = {}  # abs dir -> abs subdirs
+        self._ids: Dict[str, int] = {}
+        self._rels: Dict[int, str] = {}
+        self._next_id = 1
+        self._catalog = ""                         # hash of the LUT list `version` describes
+        self._snap = _Snapshot([])
+        self._load_ids()
+        self.refresh(full=True)
+
+    # ---------- lookups (lock-free: snapshot is swapped atomically) ----------
+
+    def all(self) -> List[str]:
+        return self._snap.luts
+
+    def categories(self) -> List[str]:
+        return self._snap.categories
+
+    def by_category(self, category: str) -> List[str]:
+        return self._snap.by_cat.get(category, [])
+
+    def id_of(self, rel: str) -> Optional[int]:
+        return self._ids.get(rel)
+
+    def rel_of(self, lut_id: int) -> Optional[str]:
+        return self._rels.get(lut_id)
+
+    def __len__(self) -> int:
+        return len(self._snap.luts)
+
+    # ---------- scanning ----------
+
+    def _rescan(self, d: str, seen: Dict[str, int], files: Dict[str, List[str]], children: Dict[str, List[str]]) -> None:
+        """Re-list `d` only if its mtime moved; always descend into known subdirs."""
+        try:
+            mtime = os.stat(d).st_mtime_ns
+        except OSError:
+            return  # directory vanished
+        seen[d] = mtime
+
+        if self._dirs.get(d) == mtime and d in self._files:
+            files[d] = self._files[d]
+            subdirs = self._children.get(d, [])
+        else:
+            found, subdirs = [], []
+            try:
+                entries = list(os.scandir(d))
+            except OSError:
+                entries = []
+            for e in entries:
+                if e.name.startswith("."):
+                    continue  # skips .lutcache and editor junk
+                if e.is_dir():
+                    if not e.is_symlink():  # like os.walk: linked dirs aren't followed (no loops)
+                        subdirs.append(e.path)
+                elif e.name.lower().endswith(".cube"):
+                    found.append(os.path.relpath(e.path, self.lut_dir).replace("\\", "/"))
+            files[d] = found
+
+        children[d] = subdirs
+        for sub in subdirs:
+            self._rescan(sub, seen, files, children)
+
+    def refresh(self, full: bool = False) -> bool:
+        """Pick up added/removed LUTs. Returns True if the catalog changed."""
+        with self._lock:
+            if full:
+                self._dirs, self._files, self._children = {}, {}, {}
+            seen: Dict[str, int] = {}
+            files: Dict[str, List[str]] = {}
+            children: Dict[str, List[str]] = {}
+            self._rescan(self.lut_dir, seen, files, children)
+
+            changed = full or seen != self._dirs
+            self._dirs, self._files, self._children = seen, files, children
+            if not changed:
+                return False
+
+            luts = sorted(rel for group in files.values() for rel in group)
+            if luts == self._snap.luts and not full:
+                return False
+
+            live = set(luts)
+            for rel in luts:
+                if rel not in self._ids:
+                    self._ids[rel] = self._next_id
+                    self._rels[self._next_id] = rel
+                    self._next_id += 1
+            for rel in [r for r in self._ids if r not in live]:
+                self._rels.pop(self._ids.pop(rel), None)
+
+            self._snap = _Snapshot(luts)
+            catalog = self._hash(luts)
+            if catalog != self._catalog:
+                # a full refresh of the catalog we saved last time keeps its version,
+                # so menus sent before a restart still work
+                self.version += 1
+                self._catalog = catalog
+            self._save_ids()
+            return True
+
+    def start_polling(self, interval: float = 30.0) -> threading.Thread:
+        def loop():
+            ev = threading.Event()
+            while not ev.wait(interval):
+                try:
+                    if self.refresh():
+                        print(f"LUT index updated: {len(self)} LUTs (v{self.version})")
+                except Exception as e:
+                    print(f"LUT index refresh failed: {e}")
+
+        t = threading.Thread(target=loop, daemon=True)
+        t.start()
+        return t
+
+    # ---------- id persistence ----------
+
+    @staticmethod
+    def _hash(luts: List[str]) -> str:
+        return hashlib.blake2b("\n".join(luts).encode("utf-8"), digest_size=8).hexdigest()
+
+    def _load_ids(self) -> None:
+        if not self.ids_path or not os.path.isfile(self.ids_path):
+            return
+        try:
+            with open(self.ids_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._ids = {str(k): int(v) for k, v in data.get("ids", {}).items()}
+            self._rels = {v: k for k, v in self._ids.items()}
+            self._next_id = max(int(data.get("next_id", 1)), max(self._rels, default=0) + 1)
+            self.version = int(data.get("version", 0))
+            self._catalog = str(data.get("catalog", ""))
+        except (OSError, ValueError) as e:
+            print(f"LUT id map unreadable ({e}); starting fresh")
+
+    def _save_ids(self) -> None:
+        if not self.ids_path:
+            return
+        tmp = self.ids_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"next_id": self._next_id, "version": self.version, "catalog": self._catalog,
+                           "ids": self._ids}, f)
+            os.replace(tmp, self.ids_path)
+        except OSError as e:
+            print(f"LUT id map write failed: {e}")
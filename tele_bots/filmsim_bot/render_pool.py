@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+render_pool.py — process-pool rendering for FilmSimBot
+
+Runs lut_engine renders in separate processes so CPU-bound NumPy work
+doesn't contend for the bot's GIL.
+
+- worker count defaults to the number of cores
+- optional per-worker address-space ceiling (RLIMIT_AS) → MemoryError, not OOM-kill
+- workers can be recycled after N jobs to cap heap fragmentation (off by
+  default: a replacement is forked from the running bot, whose other
+  threads may hold locks at fork time that then never release in the
+  child, and whose mappings count against the child's RLIMIT_AS)
+- each worker keeps its own LutCache; the compiled .npy files are mmapped,
+  so the page cache is shared between workers
+- cores left over after one per worker go to lut_engine's tile threads
+- a render that times out is stopped: its worker is killed (the pool forks
+  a replacement), or, if it hasn't started yet, it is skipped; it never
+  writes its output after the caller has given up on it
+
+Uses the "fork" start method: filmsim_bot.py starts the bot at import
+time, so spawn/forkserver (which re-import __main__) are not an option.
+
+Usage:
+    from render_pool import RenderPool
+    pool = RenderPool(processes=4, mem_limit_mb=1024, cache_dir="...")
+    pool.render("in.jpg", "/luts/x.cube", "out.jpg", 0.75, timeout=120)
+    pool.render_batch([("a.jpg", "a_out.jpg"), ("b.jpg", "b_out.jpg")], "/luts/x.cube", 0.75)
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import signal
+import time
+from typing import Optional
+
+_cache = None
+_exiftool = None
+_slots = None       # per submitted task: a state below, or the pid rendering it
+_slots_lock = None
+
+_FREE, _QUEUED, _CANCELLED, _DONE = 0, -1, -2, -3
+MAX_TASKS_IN_FLIGHT = 1024
+
+
+def _init_worker(cache_dir: Optional[str], cache_bytes: int, mem_limit_bytes: int,
+                 exiftool_timeout: Optional[float], render_threads: int, slots, slots_lock) -> None:
+    global _cache, _exiftool, _slots, _slots_lock
+    _slots, _slots_lock = slots, slots_lock
+
+    # Ctrl-C / SIGTERM are for the parent; it tears the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if mem_limit_bytes > 0:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (mem_limit_bytes, mem_limit_bytes))
+
+    import lut_engine
+    lut_engine.RENDER_THREADS = render_threads
+
+    # fresh objects: never reuse locks inherited across fork
+    from lut_cache import LutCache
+    _cache = LutCache(cache_dir, max_bytes=cache_bytes)
+
+    if exiftool_timeout is not None:
+        from exiftool_daemon import ExifToolDaemon
+        _exiftool = ExifToolDaemon(timeout=exiftool_timeout)
+
+
+def _claim(slot: int) -> bool:
+    """Mark a task as running in this worker, unless the caller already gave up on it."""
+    with _slots_lock:
+        if _slots[slot] == _CANCELLED:
+            _slots[slot] = _FREE
+            return False
+        _slots[slot] = os.getpid()
+        return True
+
+
+def _release(slot: int) -> None:
+    """The task is over; from here on its pid belongs to the worker's next task."""
+    with _slots_lock:
+        if _slots[slot] == os.getpid():
+            _slots[slot] = _DONE
+
+
+def _render(slot: int, in_path: str, lut_path: str, out_path: str, intensity: float, max_side: Optional[int],
+            max_bytes: Optional[int]) -> Optional[dict]:
+    if not _claim(slot):
+        return None
+    try:
+        import lut_engine
+        t0 = time.perf_counter()
+        lut = _cache.get(lut_path)
+        timings = {"lut_load": time.perf_counter() - t0}
+        lut_engine.render_file(in_path, lut_path, out_path, intensity, lut=lut, exiftool=_exiftool,
+                               timings=timings, max_side=max_side, max_bytes=max_bytes)
+        return timings
+    finally:
+        _release(slot)
+
+
+def _render_batch(slot: int, items: list, lut_path: str, intensity: float, max_side: Optional[int],
+                  max_bytes: Optional[int]) -> Optional[list]:
+    if not _claim(slot):
+        return None
+    try:
+        import lut_engine
+        t0 = time.perf_counter()
+        lut = _cache.get(lut_path)
+        lut_load = time.perf_counter() - t0
+        timings = lut_engine.render_files(items, lut_path, intensity, lut=lut, exiftool=_exiftool,
+                                          max_side=max_side, max_bytes=max_bytes)
+        timings[0]["lut_load"] = lut_load
+        return timings
+    finally:
+        _release(slot)
+
+
+class RenderPool:
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        max_tasks: int = 0,
+        mem_limit_mb: int = 0,
+        cache_dir: Optional[str] = None,
+        cache_mb: int = 128,
+        exiftool_timeout: Optional[float] = None,
+    ):
+        self.processes = processes or os.cpu_count() or 1
+        ctx = multiprocessing.get_context("fork")
+        # inherited by every worker, including the ones forked to replace killed workers
+        self._slots = ctx.RawArray("q", MAX_TASKS_IN_FLIGHT)
+        self._slots_lock = ctx.Lock()
+        self._pool = ctx.Pool(
+            processes=self.processes,
+            initializer=_init_worker,
+            initargs=(cache_dir, cache_mb * 1024 * 1024, mem_limit_mb * 1024 * 1024, exiftool_timeout,
+                      int(os.environ.get("FILMSIM_RENDER_THREADS", "0"))
+                      or max(1, (os.cpu_count() or 1) // self.processes),
+                      self._slots, self._slots_lock),
+            maxtasksperchild=max_tasks or None,
+        )
+
+    # ---------- task slots ----------
+
+    def _submit(self, fn, args: tuple):
+        with self._slots_lock:
+            for slot in range(len(self._slots)):
+                if self._slots[slot] == _FREE:
+                    self._slots[slot] = _QUEUED
+                    break
+            else:
+                raise RuntimeError("too many renders in flight")
+        try:
+            return slot, self._pool.apply_async(fn, (slot,) + args)
+        except BaseException:
+            self._finish(slot)
+            raise
+
+    def _finish(self, slot: int) -> None:
+        with self._slots_lock:
+            self._slots[slot] = _FREE
+
+    def _abandon(self, slot: int) -> None:
+        """Stop a task that timed out: kill its worker, or make sure it never starts."""
+        with self._slots_lock:
+            state = self._slots[slot]
+            if state == _QUEUED:
+                self._slots[slot] = _CANCELLED  # the worker that picks it up frees the slot
+                return
+            self._slots[slot] = _FREE
+            if state > 0:
+                # under the lock, so the worker can't be holding it when it dies
+                try:
+                    os.kill(state, signal.SIGKILL)  # the pool notices the exit and forks a replacement
+                except ProcessLookupError:
+                    pass
+        if state > 0:
+            print(f"render pool: killed worker {state} after a timeout")
+
+    def _wait(self, slot: int, res, timeout: float):
+        try:
+            out = res.get(timeout)
+        except multiprocessing.TimeoutError:
+            self._abandon(slot)
+            raise
+        except BaseException:
+            self._finish(slot)
+            raise
+        self._finish(slot)
+        return out
+
+    def render(self, in_path: str, lut_path: str, out_path: str, intensity: float, timeout: float = 120,
+               max_side: Optional[int] = None, max_bytes: Optional[int] = None) -> dict:
+        """
+        Blocks the calling thread (not the GIL) until done. Returns per-stage
+        timings in seconds. Raises multiprocessing.TimeoutError, after
+        stopping the render.
+        """
+        slot, res = self._submit(_render, (in_path, lut_path, out_path, float(intensity), max_side, max_bytes))
+        return self._wait(slot, res, timeout)
+
+    def render_batch(self, items: list, lut_path: str, intensity: float, timeout: float = 120,
+                     max_side: Optional[int] = None, max_bytes: Optional[int] = None) -> list:
+        """
+        Render (in_path, out_path) pairs with one LUT, split across the
+        workers; each worker pipelines its share (lut_engine.render_files).
+        Returns per-item timings in order. `timeout` is for the whole batch.
+        """
+        n = max(1, min(self.processes, len(items)))
+        shares = [items[i::n] for i in range(n)]
+        tasks = [self._submit(_render_batch, (share, lut_path, float(intensity), max_side, max_bytes))
+                 for share in shares if share]
+        deadline = time.monotonic() + timeout
+        out = [None] * len(items)
+        waited = 0
+        try:
+            for i, (slot, res) in enumerate(tasks):
+                waited += 1  # _wait frees (or abandons) the slot whatever happens
+                for j, t in enumerate(self._wait(slot, res, max(0.0, deadline - time.monotonic()))):
+                    out[i + j * n] = t
+        except BaseException:
+            # one share failed or timed out: stop the ones not waited for yet
+            for slot, _ in tasks[waited:]:
+                self._abandon(slot)
+            raise
+        return out
+
+    def close(self) -> None:
+        self._pool.terminate()
+        self._pool.join()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+session_store.py — bounded per-user browsing sessions for FilmSimBot
+
+Replaces the plain STATE dict:
+- one small __slots__ record per user; the selected LUT is kept as its
+  stable LutIndex id, menus come from the shared catalog (keyboards.py)
+- idle sessions expire after `ttl` seconds; at most `max_sessions` are
+  held in memory, least recently used evicted first
+- optional SQLite persistence (a `sessions` table): touched sessions are
+  written behind in one transaction every `flush_interval` seconds and
+  on close(); a memory miss falls back to the table, so selections
+  survive restarts and LRU eviction
+
+Usage:
+    from session_store import SessionStore
+    sessions = SessionStore("/path/to/filmsim.db", ttl=86400)
+    st = sessions.new(uid, in_path="...", in_hash="...", source="photo")
+    st = sessions.get(uid)      # None if unknown or expired
+    st.lut_id = 42
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from lut_index import CATEGORY_ALL
+
+
+class Session:
+    __slots__ = ("in_path", "in_hash", "source", "cat", "cat_page", "page", "lut_id", "album", "touched")
+
+    FIELDS = ("in_path", "in_hash", "source", "cat", "cat_page", "page", "lut_id", "album")
+
+    def __init__(self, in_path: Optional[str] = None, in_hash: Optional[str] = None, source: str = "photo",
+                 cat: str = CATEGORY_ALL, cat_page: int = 0, page: int = 0, lut_id: Optional[int] = None,
+                 album: Optional[list] = None, touched: Optional[float] = None):
+        self.in_path = in_path
+        self.in_hash = in_hash
+        self.source = source          # photo | document
+        self.cat = cat
+        self.cat_page = cat_page
+        self.page = page
+        self.lut_id = lut_id          # LutIndex id of the selected LUT
+        self.album = album            # [[in_path, in_hash], ...] for an album; in_path is its first photo
+        self.touched = touched or time.time()
+
+    def to_json(self) -> str:
+        return json.dumps({f: getattr(self, f) for f in self.FIELDS})
+
+    @classmethod
+    def from_json(cls, data: str, touched: float) -> "Session":
+        raw = json.loads(data)
+        return cls(**{f: raw[f] for f in cls.FIELDS if f in raw}, touched=touched)
+
+
+class SessionStore:
+    def __init__(self, db_path: Optional[str] = None, ttl: float = 86400, max_sessions: int = 5000,
+                 flush_interval: float = 5.0):
+        self.db_path = os.path.abspath(db_path) if db_path else None
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[int, Session]" = OrderedDict()   # LRU order, oldest first
+        self._dirty: Dict[int, Optional[Session]] = {}           # None = delete
+        self._local = threading.local()
+        if self.db_path:
+            self._init_db()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.db_path)
+            con.execute("PRAGMA journal_mode=WAL;")
+            con.execute("PRAGMA synchronous=NORMAL;")
+            self._local.con = con
+        return con
+
+    def _init_db(self) -> None:
+        with self._connect() as con:
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    telegram_id INTEGER PRIMARY KEY,
+                    data        TEXT    NOT NULL,   -- Session fields as JSON
+                    touched     REAL    NOT NULL
+                )
+                """
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS sessions_touched ON sessions(touched)")
+
+    # ---------- access ----------
+
+    def get(self, uid: int) -> Optional[Session]:
+        """The user's session (marked as used), or None if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            st = self._mem.get(uid)
+            if st is None and uid in self._dirty:
+                st = self._dirty[uid]  # evicted from memory but not flushed yet
+                if st is None:
+                    return None        # popped, delete not flushed yet
+            if st is not None:
+                if now - st.touched <= self.ttl:
+                    return self._use(uid, st, now)
+                self._drop(uid)
+                return None
+        if not self.db_path:
+            return None
+
+        st = self._load(uid)
+        with self._lock:
+            if uid in self._mem or uid in self._dirty:
+                # new()/pop() for this user ran while we were reading
+                st = self._mem.get(uid) or self._dirty.get(uid)
+                return self._use(uid, st, now) if st is not None else None
+            if st is None or now - st.touched > self.ttl:
+                return None  # expired rows are deleted on flush
+            return self._use(uid, st, now)
+
+    def new(self, uid: int, **fields) -> Session:
+        """Start a fresh session (a new photo), replacing any existing one."""
+        with self._lock:
+            return self._use(uid, Session(**fields), time.time())
+
+    def setdefault(self, uid: int) -> Session:
+        return self.get(uid) or self.new(uid)
+
+    def pop(self, uid: int) -> None:
+        with self._lock:
+            self._drop(uid)
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    # ---------- internals ----------
+
+    def _use(self, uid: int, st: Session, now: float) -> Session:
+        """Caller holds the lock. Callers may mutate `st`, so it is queued for writing."""
+        st.touched = now
+        self._mem[uid] = st
+        self._mem.move_to_end(uid)
+        if self.db_path:
+            self._dirty[uid] = st
+        while len(self._mem) > self.max_sessions:
+            self._mem.popitem(last=False)  # still in the table (or _dirty) if persisted
+        return st
+
+    def _drop(self, uid: int) -> None:
+        """Caller holds the lock."""
+        self._mem.pop(uid, None)
+        if self.db_path:
+            self._dirty[uid] = None
+
+    def _load(self, uid: int) -> Optional[Session]:
+        row = self._connect().execute(
+            "SELECT data, touched FROM sessions WHERE telegram_id=?", (uid,)
+        ).fetchone()
+        if not row:
+            return None
+        try:
+            return Session.from_json(*row)
+        except (ValueError, TypeError):
+            return None
+
+    def _expire(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            stale = [uid for uid, st in self._mem.items() if st.touched < cutoff]
+            for uid in stale:
+                del self._mem[uid]
+        return len(stale)
+
+    def flush(self) -> int:
+        """Write touched sessions and deletions in one transaction. Returns rows written."""
+        if not self.db_path:
+            return 0
+        with self._lock:
+            batch, self._dirty = self._dirty, {}
+            rows = [(uid, st.to_json(), st.touched) for uid, st in batch.items() if st is not None]
+        gone = [(uid,) for uid, st in batch.items() if st is None]
+        try:
+            with self._connect() as con:
+                con.executemany(
+                    """
+                    INSERT INTO sessions (telegram_id, data, touched) VALUES (?, ?, ?)
+                    ON CONFLICT(telegram_id) DO UPDATE SET data=excluded.data, touched=excluded.touched
+                    """,
+                    rows,
+                )
+                con.executemany("DELETE FROM sessions WHERE telegram_id=?", gone)
+                con.execute("DELETE FROM sessions WHERE touched < ?", (time.time() - self.ttl,))
+        except sqlite3.Error:
+            with self._lock:
+                for uid, st in batch.items():
+                    self._dirty.setdefault(uid, st)  # keep newer changes, retry the rest
+            raise
+        return len(rows) + len(gone)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self._expire()
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"session store flush failed: {e}")
+
+    def close(self) -> None:
+        self.flush()
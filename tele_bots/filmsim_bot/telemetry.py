@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+telemetry.py — per-job timing telemetry for FilmSimBot
+
+Each export records seconds per stage (queue_wait, lut_load, decode, render,
+encode, metadata, upload, total). Records are buffered and written by a
+background thread in one transaction per flush, into:
+
+- job_timings    raw rows (kept `keep_days`), incl. free-form JSON extras
+- timing_hist    per hour/stage log-scale histograms → fast p50/p95/p99
+- job_hourly     per hour job/failure counts and queue-depth samples
+- disk_hourly    per hour bytes reclaimed by the work-dir janitor, last usage
+- encoder_hourly per hour size-targeted JPEG encodes, re-encodes, quality/bytes sums
+
+Reports only read the rollup tables, so they stay fast as history grows.
+
+Usage:
+    from telemetry import Telemetry
+    tm = Telemetry("/path/to/filmsim_telemetry.db")
+    tm.record({"render": 1.2, "upload": 0.8}, outcome="ok", queue_depth=3)
+    print(tm.report(hours=24))
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+STAGES = ("queue_wait", "lut_load", "decode", "render", "encode", "metadata", "upload", "total")
+
+# histogram buckets: 1ms * 1.15^k  (~7% error on percentiles)
+_BUCKET_BASE_MS = 1.0
+_BUCKET_RATIO = 1.15
+
+
+def _bucket(seconds: float) -> int:
+    ms = max(seconds * 1000.0, _BUCKET_BASE_MS)
+    return int(math.log(ms / _BUCKET_BASE_MS, _BUCKET_RATIO))
+
+
+def _bucket_seconds(bucket: int) -> float:
+    # geometric midpoint of the bucket
+    return _BUCKET_BASE_MS * _BUCKET_RATIO ** (bucket + 0.5) / 1000.0
+
+
+class Telemetry:
+    def __init__(self, db_path: str, flush_interval: float = 5.0, keep_days: int = 14):
+        self.db_path = os.path.abspath(db_path)
+        self.flush_interval = flush_interval
+        self.keep_days = keep_days
+        self._buf: List[tuple] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._init_db()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.db_path)
+            con.execute("PRAGMA journal_mode=WAL;")
+            con.execute("PRAGMA synchronous=NORMAL;")
+            self._local.con = con
+        return con
+
+    def _init_db(self) -> None:
+        stage_cols = ",\n".join(f"{s} REAL" for s in STAGES)
+        with self._connect() as con:
+            con.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS job_timings (
+                    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts          REAL    NOT NULL,
+                    outcome     TEXT    NOT NULL,  -- ok | cached | error
+                    queue_depth INTEGER,
+                    {stage_cols},
+                    extra       TEXT               -- JSON, nullable
+                )
+                """
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS job_timings_ts ON job_timings(ts)")
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS timing_hist (
+                    hour   INTEGER NOT NULL,   -- unix hour (ts // 3600)
+                    stage  TEXT    NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count  INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (hour, stage, bucket)
+                )
+                """
+            )
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_hourly (
+                    hour        INTEGER PRIMARY KEY,
+                    jobs        INTEGER NOT NULL DEFAULT 0,
+                    failures    INTEGER NOT NULL DEFAULT 0,
+                    cached      INTEGER NOT NULL DEFAULT 0,
+                    depth_sum   INTEGER NOT NULL DEFAULT 0,
+                    depth_max   INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            new_encoder_table = not con.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='encoder_hourly'"
+            ).fetchone()
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS encoder_hourly (
+                    hour        INTEGER PRIMARY KEY,
+                    encodes     INTEGER NOT NULL DEFAULT 0,   -- size-targeted
+                    reencoded   INTEGER NOT NULL DEFAULT 0,   -- needed more than one pass
+                    quality_sum INTEGER NOT NULL DEFAULT 0,
+                    bytes_sum   INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            if new_encoder_table:
+                # one-off: roll up what the raw rows still hold from before the table existed
+                con.execute(
+                    """
+                    INSERT INTO encoder_hourly (hour, encodes, reencoded, quality_sum, bytes_sum)
+                    SELECT CAST(ts / 3600 AS INTEGER), COUNT(*),
+                           SUM(json_extract(extra, '$.encoder.passes') > 1),
+                           SUM(json_extract(extra, '$.encoder.quality')),
+                           SUM(json_extract(extra, '$.encoder.bytes'))
+                    FROM job_timings
+                    WHERE json_extract(extra, '$.encoder.predicted') IS NOT NULL
+                    GROUP BY 1
+                    """
+                )
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS disk_hourly (
+                    hour        INTEGER PRIMARY KEY,
+                    runs        INTEGER NOT NULL DEFAULT 0,
+                    reclaimed   INTEGER NOT NULL DEFAULT 0,   -- bytes
+                    evicted     INTEGER NOT NULL DEFAULT 0,   -- user directories
+                    used        INTEGER NOT NULL DEFAULT 0,   -- bytes after the last run
+                    budget      INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+
+    # ---------- recording ----------
+
+    def record(self, timings: Dict[str, float], outcome: str = "ok",
+               queue_depth: Optional[int] = None, **extra) -> None:
+        """Non-blocking: buffers the row for the next flush."""
+        row = (time.time(), outcome, queue_depth, dict(timings), extra or None)
+        with self._lock:
+            self._buf.append(row)
+
+    def record_disk(self, reclaimed: int, evicted: int, used: int, budget: int) -> None:
+        """One janitor run. Written straight away: it's a few rows an hour, from a background thread."""
+        with self._connect() as con:
+            con.execute(
+                """
+                INSERT INTO disk_hourly (hour, runs, reclaimed, evicted, used, budget)
+                VALUES (?, 1, ?, ?, ?, ?)
+                ON CONFLICT(hour) DO UPDATE SET
+                    runs = runs + 1,
+                    reclaimed = reclaimed + excluded.reclaimed,
+                    evicted = evicted + excluded.evicted,
+                    used = excluded.used,
+                    budget = excluded.budget
+                """,
+                (int(time.time() // 3600), reclaimed, evicted, used, budget),
+            )
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._buf = self._buf, []
+        if not batch:
+            return 0
+
+        raw, hist, hourly, encoder = [], {}, {}, {}
+        for ts, outcome, depth, t, extra in batch:
+            raw.append((ts, outcome, depth, *[t.get(s) for s in STAGES],
+                        json.dumps(extra) if extra else None))
+            hour = int(ts // 3600)
+            for stage in STAGES:
+                v = t.get(stage)
+                if v is not None:
+                    key = (hour, stage, _bucket(v))
+                    hist[key] = hist.get(key, 0) + 1
+            h = hourly.setdefault(hour, [0, 0, 0, 0, 0])
+            h[0] += 1
+            h[1] += outcome == "error"
+            h[2] += outcome == "cached"
+            h[3] += depth or 0
+            h[4] = max(h[4], depth or 0)
+            enc = (extra or {}).get("encoder")
+            if enc and enc.get("predicted") is not None:
+                e = encoder.setdefault(hour, [0, 0, 0, 0])
+                e[0] += 1
+                e[1] += (enc.get("passes") or 0) > 1
+                e[2] += enc.get("quality") or 0
+                e[3] += enc.get("bytes") or 0
+
+        cols = ", ".join(STAGES)
+        marks = ", ".join("?" for _ in STAGES)
+        with self._connect() as con:
+            con.executemany(
+                f"INSERT INTO job_timings (ts, outcome, queue_depth, {cols}, extra) VALUES (?, ?, ?, {marks}, ?)",
+                raw,
+            )
+            con.executemany(
+                """
+                INSERT INTO timing_hist (hour, stage, bucket, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT(hour, stage, bucket) DO UPDATE SET count = count + excluded.count
+                """,
+                [(*k, n) for k, n in hist.items()],
+            )
+            con.executemany(
+                """
+                INSERT INTO job_hourly (hour, jobs, failures, cached, depth_sum, depth_max)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(hour) DO UPDATE SET
+                    jobs = jobs + excluded.jobs,
+                    failures = failures + excluded.failures,
+                    cached = cached + excluded.cached,
+                    depth_sum = depth_sum + excluded.depth_sum,
+                    depth_max = MAX(depth_max, excluded.depth_max)
+                """,
+                [(hour, *v) for hour, v in hourly.items()],
+            )
+            con.executemany(
+                """
+                INSERT INTO encoder_hourly (hour, encodes, reencoded, quality_sum, bytes_sum)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(hour) DO UPDATE SET
+                    encodes = encodes + excluded.encodes,
+                    reencoded = reencoded + excluded.reencoded,
+                    quality_sum = quality_sum + excluded.quality_sum,
+                    bytes_sum = bytes_sum + excluded.bytes_sum
+                """,
+                [(hour, *v) for hour, v in encoder.items()],
+            )
+            con.execute("DELETE FROM job_timings WHERE ts < ?", (time.time() - self.keep_days * 86400,))
+        return len(batch)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"telemetry flush failed: {e}")
+
+    # ---------- reporting ----------
+
+    def percentiles(self, hours: int = 24, qs=(0.50, 0.95, 0.99)) -> Dict[str, List[float]]:
+        since = int(time.time() // 3600) - hours + 1
+        with self._connect() as con:
+            rows = con.execute(
+                """
+                SELECT stage, bucket, SUM(count) FROM timing_hist
+                WHERE hour >= ? GROUP BY stage, bucket ORDER BY stage, bucket
+                """,
+                (since,),
+            ).fetchall()
+
+        by_stage: Dict[str, List[tuple]] = {}
+        for stage, bucket, n in rows:
+            by_stage.setdefault(stage, []).append((bucket, n))
+
+        out = {}
+        for stage, buckets in by_stage.items():
+            total = sum(n for _, n in buckets)
+            vals, seen, i = [], 0, 0
+            for q in qs:
+                target = q * total
+                while i < len(buckets) and seen + buckets[i][1] < target:
+                    seen += buckets[i][1]
+                    i += 1
+                vals.append(_bucket_seconds(buckets[min(i, len(buckets) - 1)][0]))
+            out[stage] = vals
+        return out
+
+    def hourly(self, hours: int = 24) -> List[tuple]:
+        since = int(time.time() // 3600) - hours + 1
+        with self._connect() as con:
+            return con.execute(
+                """
+                SELECT hour, jobs, failures, cached, depth_sum, depth_max
+                FROM job_hourly WHERE hour >= ? ORDER BY hour
+                """,
+                (since,),
+            ).fetchall()
+
+    def encoder_stats(self, hours: int = 24) -> Optional[tuple]:
+        """(size-targeted encodes, re-encodes, avg quality, avg MB) over the window."""
+        since = int(time.time() // 3600) - hours + 1
+        with self._connect() as con:
+            row = con.execute(
+                """
+                SELECT SUM(encodes), SUM(reencoded),
+                       1.0 * SUM(quality_sum) / SUM(encodes),
+                       SUM(bytes_sum) / 1048576.0 / SUM(encodes)
+                FROM encoder_hourly WHERE hour >= ?
+                """,
+                (since,),
+            ).fetchone()
+        return row if row and row[0] else None
+
+    def disk_stats(self, hours: int = 24) -> Optional[tuple]:
+        """(bytes reclaimed, directories evicted, latest usage, budget) over the window."""
+        since = int(time.time() // 3600) - hours + 1
+        with self._connect() as con:
+            row = con.execute(
+                """
+                SELECT SUM(reclaimed), SUM(evicted),
+                       (SELECT used FROM disk_hourly ORDER BY hour DESC LIMIT 1),
+                       (SELECT budget FROM disk_hourly ORDER BY hour DESC LIMIT 1)
+                FROM disk_hourly WHERE hour >= ?
+                """,
+                (since,),
+            ).fetchone()
+        return row if row and row[0] is not None else None
+
+    def report(self, hours: int = 24) -> str:
+        self.flush()
+        pct = self.percentiles(hours)
+        rows = self.hourly(hours)
+        if not rows:
+            return f"No exports in the last {hours}h."
+
+        jobs = sum(r[1] for r in rows)
+        fails = sum(r[2] for r in rows)
+        cached = sum(r[3] for r in rows)
+        peak = max(rows, key=lambda r: r[1])
+        depth_avg = sum(r[4] for r in rows) / max(1, jobs)
+        depth_max = max(r[5] for r in rows)
+
+        lines = [
+            f"Last {hours}h: {jobs} jobs ({fails} failed, {cached} from cache)",
+            f"Throughput: {jobs / hours:.1f}/h avg, peak {peak[1]}/h at "
+            f"{time.strftime('%m-%d %H:00', time.gmtime(peak[0] * 3600))} UTC",
+            f"Queue depth at start: avg {depth_avg:.1f}, max {depth_max}",
+            "",
+            "stage        p50     p95     p99   (seconds)",
+        ]
+        for stage in STAGES:
+            if stage in pct:
+                p50, p95, p99 = pct[stage]
+                lines.append(f"{stage:<11}{p50:>6.2f}  {p95:>6.2f}  {p99:>6.2f}")
+        enc = self.encoder_stats(hours)
+        if enc:
+            n, redone, q, mb = enc
+            lines += ["", f"JPEG: {n} size-targeted, {redone or 0} re-encoded, avg q{q:.0f}, avg {mb:.1f}MB"]
+        disk = self.disk_stats(hours)
+        if disk:
+            reclaimed, evicted, used, budget = disk
+            lines.append(f"Disk: {reclaimed / 1048576:.0f}MB reclaimed ({evicted} inputs evicted), "
+                         f"work dir {used / 1048576:.0f}/{budget / 1048576:.0f}MB")
+        return "\n".join(lines)